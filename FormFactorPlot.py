@@ -16,11 +16,17 @@ from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg,
 NavigationToolbar2Tk)
 import matplotlib as mpl
 import numpy as np
-import os, math
+import os, math, multiprocessing, json, hashlib, queue, threading, sqlite3, pathlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# pool of worker threads for loading and evaluating in the background while the windows stay responsive
+worker_pool = ThreadPoolExecutor(max_workers=4)
 
 # class to gather and evaluate the form factor data
 class data:
-    def __init__(self,filename,origin):
+    # with quiet, errors in the file are only collected in self.errors instead of shown, as required in worker threads
+    # progress(done,total) is called after every step of the parsing
+    def __init__(self,filename,origin,quiet=False,progress=None):
         self.filename = filename
         
         self.expansion = 5 # size of the expansion in Gaussians, 4 for set-size 9 and 5 for set-size 11, current max
@@ -28,12 +34,21 @@ class data:
         self.labels = []
         self.data = []
         self.valid = True
+        self.errors = ""
+        self.quiet = quiet
+        self.progress = progress
         
         self.retrieve_data(filename)
+        self.report(1)
         
         if self.valid == True: # only sort if data is validated
             self.sort_data()  
     
+    # reports the number of finished parsing steps
+    def report(self,step):
+        if self.progress is not None:
+            self.progress(step,8)
+    
     # feeds in the data from the csv
     def retrieve_data(self,filename):
         with open(filename,mode="r") as file:
@@ -74,7 +89,9 @@ class data:
         # if the checks return any error, identify those errors
         if len(errors) > 0:
             errors += "Make sure that the file is a properly formatted csv with commas (,) as separators no additional line breaks."
-            messagebox.showerror("Error in input file!", errors)
+            self.errors = errors
+            if self.quiet == False:
+                messagebox.showerror("Error in input file!", errors)
             self.valid = False
             
     # sort the raw data into the relevant variable lists
@@ -93,7 +110,7 @@ class data:
                     self.comment[i] += "ox. miss."
                 ox = 0
             self.ox_list[i] = ox
-        
+        self.report(2)
         
         # create list of elements, read out oxidation states if included in label
         self.el_list = [""] * len(self.data)
@@ -124,6 +141,7 @@ class data:
             self.el_list[i] = el
             if num != "":
                 self.ox_list[i] = int(sign+num)
+        self.report(3)
                 
         # create alternative list of nuclear charge Z if available
         self.Z_list = [""] * len(self.data)
@@ -133,18 +151,21 @@ class data:
             else:
                 Z = "0"
             self.Z_list[i] = Z
+        self.report(4)
             
         # create list of data sources
         self.sources_list = [""] * len(self.data)
         for i in range(len(self.data)):
             source = self.data[i][self.labels.index("source")]
             self.sources_list[i] = source
+        self.report(5)
             
         # create list of fitting set size
         self.set_list = [""] * len(self.data)
         for i in range(len(self.data)):
             set_type = int(self.data[i][self.labels.index("set-type")])
             self.set_list[i] = set_type
+        self.report(6)
             
         # create lists of the parameters aX, bX with X = {1,2,3,4,5} and c depending on fitting set size
         self.a_list = [0] * len(self.data)
@@ -180,12 +201,436 @@ class data:
             except:
                 self.c_list[i] = 0
                 self.comment[i] += "c "       
+        self.report(7)
+        
+        self.build_coefficients()
+        self.report(8)
+    
+    # collects the parameters of all items in arrays padded with zeros to the full expansion size
+    def build_coefficients(self):
+        self.a_array = np.zeros((len(self.data),self.expansion))
+        self.b_array = np.zeros((len(self.data),self.expansion))
+        for i in range(len(self.data)):
+            self.a_array[i,:len(self.a_list[i])] = self.a_list[i]
+            self.b_array[i,:len(self.b_list[i])] = self.b_list[i]
+        self.c_array = np.array(self.c_list,dtype=float)
+    
+    # returns the parsed database as arrays, used to store it in session files
+    # the raw rows of the csv are not stored, everything after parsing is derived from the columns
+    def snapshot(self):
+        a, b, c = self.coefficients(range(len(self.data)))
+        return {"labels": np.array(self.labels,dtype=str),
+                "comment": np.array(list(self.comment),dtype=str),
+                "ox": np.array(list(self.ox_list),dtype=int),
+                "el": np.array(list(self.el_list),dtype=str),
+                "Z": np.array(list(self.Z_list),dtype=str),
+                "source": np.array(list(self.sources_list),dtype=str),
+                "set": np.array(list(self.set_list),dtype=int),
+                "a": np.asarray(a,dtype=float), "b": np.asarray(b,dtype=float), "c": np.asarray(c,dtype=float)}
+    
+    # rebuilds a parsed database from a snapshot without reading and parsing the csv,
+    # fingerprint is the one of the file the snapshot was taken from
+    # snapshots of the first session format hold plain lists including the raw rows
+    @classmethod
+    def from_snapshot(cls,filename,state,fingerprint=None):
+        database = cls.__new__(cls)
+        database.filename = filename
+        database.fingerprint = fingerprint
+        database.expansion = 5
+        database.valid = True
+        database.errors = ""
+        database.quiet = True
+        database.progress = None
+        if "a_list" in state:
+            for name in state:
+                setattr(database,name,state[name])
+            database.build_coefficients()
+            return database
+        
+        database.labels = state["labels"].tolist()
+        database.comment = state["comment"].tolist()
+        database.ox_list = state["ox"].tolist()
+        database.el_list = state["el"].tolist()
+        database.Z_list = state["Z"].tolist()
+        database.sources_list = state["source"].tolist()
+        database.set_list = state["set"].tolist()
+        database.a_array = state["a"]
+        database.b_array = state["b"]
+        database.c_array = state["c"]
+        database.c_list = database.c_array.tolist()
+        sizes = [(set_type-1)//2 for set_type in database.set_list]
+        database.a_list = [row[:n] for row, n in zip(database.a_array.tolist(),sizes)]
+        database.b_list = [row[:n] for row, n in zip(database.b_array.tolist(),sizes)]
+        # only the number of rows is used after parsing
+        database.data = [None] * len(database.el_list)
+        return database
+    
+    # returns the width of the source column for the given items
+    def source_width(self,keys):
+        max_len = 6 # length of source string is variable, but should be at least this long
+        # determines the length of the longest source string
+        for i in keys:
+            str_len = len(self.sources_list[i])
+            if str_len > max_len:
+                max_len = str_len
+        return max_len
+    
+    # returns the keys of all items matching the filter string for the given setting ("el", "source", "index", or "reset")
+    def query(self,setting,str):
+        keys = []
+        perfect_match = False
+        check = [""] * len(self.el_list)
+        check_alt = [""] * len(self.el_list)
+        
+        # determine from where to retrieve the reference data
+        if setting == "el":
+            check = self.el_list
+            check_alt = self.Z_list
+            perfect_match = True
+        if setting == "source":
+            check = self.sources_list
+        
+        # determine which items from the reference data are retained
+        if str == "" or str == "All" or setting == "reset":
+            keys = list(range(len(self.data)))
+        elif setting == "index":
+            for i in str.split(","):
+                try:
+                    i = int(i)
+                except:
+                    messagebox.showerror("Input Error", "Only numbers, spaces, and commas are valid inputs.")
+                    break
+                if i < 0 or i >= len(self.data):
+                    messagebox.showerror("Input Error", "Numbers must be between {} and {}.".format(0,len(self.data)-1))
+                    break
+                keys.append(i)
+        else:
+            for i in range(len(self.data)):
+                if str == check[i].split(" ")[0] and perfect_match == True or str in check[i] and perfect_match == False:
+                    keys.append(i)
+                elif str == check_alt[i] and perfect_match == True:
+                    keys.append(i)
+        return keys
+    
+    # makes sure the given items are in memory, all items of a csv database always are
+    def load(self,keys):
+        pass
+    
+    # returns the parameters a, b, and c of the given items as arrays padded to the full expansion size
+    def coefficients(self,keys):
+        keys = np.asarray(keys,dtype=int)
+        return self.a_array[keys], self.b_array[keys], self.c_array[keys]
+    
+    # returns f(Q) of the given items on the given Q values as an (items x points) array,
+    # the temperature factor is applied in evaluate_form_factors
+    def evaluate(self,keys,q,dtype=np.float64):
+        s2 = (np.asarray(q,dtype=dtype)/(4*math.pi))**2
+        a, b, c = self.coefficients(keys)
+        a = a.astype(dtype)
+        b = b.astype(dtype)
+        
+        # sums the Gaussians term by term to avoid a (items x expansion x points) intermediate
+        f = np.repeat(c.astype(dtype)[:,np.newaxis],len(s2),axis=1)
+        for j in range(self.expansion):
+            f += a[:,j,np.newaxis] * np.exp(-b[:,j,np.newaxis] * s2[np.newaxis,:])
+        return f
      
+# columns of the SQLite database, the parsing remarks of the csv are kept in "remark"
+sqlite_columns = ["key","source","set_type","element","element_key","z","ox","c","a1","b1","a2","b2","a3","b3","a4","b4","a5","b5","remark","raw"]
+
+# parses a csv database once and stores it as indexed SQLite database
+def import_sqlite(csv_filename,db_filename):
+    database = data(csv_filename,None,quiet=True)
+    if database.valid == False:
+        raise ValueError(database.errors)
+    if os.path.isfile(db_filename):
+        os.remove(db_filename)
+    
+    connection = sqlite3.connect(db_filename)
+    with connection:
+        connection.execute("""CREATE TABLE items (key INTEGER PRIMARY KEY, source TEXT, set_type INTEGER, element TEXT,
+            element_key TEXT, z TEXT, ox INTEGER, c REAL, a1 REAL, b1 REAL, a2 REAL, b2 REAL, a3 REAL, b3 REAL,
+            a4 REAL, b4 REAL, a5 REAL, b5 REAL, remark TEXT, raw TEXT)""")
+        rows = []
+        for i in range(len(database.data)):
+            a = database.a_list[i] + [None]*(database.expansion-len(database.a_list[i]))
+            b = database.b_list[i] + [None]*(database.expansion-len(database.b_list[i]))
+            rows.append([i,database.sources_list[i],database.set_list[i],database.el_list[i],database.el_list[i].split(" ")[0],
+                         database.Z_list[i],database.ox_list[i],database.c_list[i]]
+                        + [value for pair in zip(a,b) for value in pair]
+                        + [database.comment[i],",".join(database.data[i])])
+        connection.executemany("INSERT INTO items VALUES ({})".format(",".join("?"*len(sqlite_columns))),rows)
+        for column in ["element_key","z","ox","source","set_type"]:
+            connection.execute("CREATE INDEX index_{0} ON items ({0})".format(column))
+    connection.close()
+
+# opens a database as csv or, for .sqlite and .db files, through the SQLite backend
+def open_database(filename,origin=None,quiet=False,progress=None):
+    if filename.lower().endswith((".sqlite",".db")):
+        return sqlite_data(filename)
+    return data(filename,origin,quiet,progress)
+
+# column of a SQLite database that reads like the lists of the csv database, rows are loaded on first access
+class sqlite_column:
+    def __init__(self,database,index):
+        self.database = database
+        self.index = index
+    
+    def __len__(self):
+        return self.database.count
+    
+    def __getitem__(self,key):
+        if key < 0 or key >= self.database.count:
+            raise IndexError(key)
+        return self.database.row(key)[self.index]
+
+# class to read a form factor database from SQLite instead of a csv, with the same interface as data
+# filters are pushed down as indexed queries and only the rows that are actually used are loaded
+# the file is opened read-only, so many windows, tools, and processes can read it at the same time
+class sqlite_data(data):
+    def __init__(self,filename):
+        self.filename = filename
+        self.expansion = 5
+        self.labels = list(sqlite_columns)
+        self.valid = True
+        self.errors = ""
+        self.quiet = True
+        self.progress = None
+        self.read_ahead = 1000 # rows loaded together on sequential access
+        self.connect()
+        
+        self.data = sqlite_column(self,"raw")
+        self.sources_list = sqlite_column(self,"source")
+        self.set_list = sqlite_column(self,"set_type")
+        self.el_list = sqlite_column(self,"element")
+        self.Z_list = sqlite_column(self,"z")
+        self.ox_list = sqlite_column(self,"ox")
+        self.c_list = sqlite_column(self,"c")
+        self.a_list = sqlite_column(self,"a")
+        self.b_list = sqlite_column(self,"b")
+        self.comment = sqlite_column(self,"remark")
+    
+    def connect(self):
+        self.lock = threading.Lock()
+        self.rows = {}
+        # as_uri escapes characters such as # and % and handles drive letters on Windows
+        uri = pathlib.Path(os.path.abspath(self.filename)).as_uri()+"?mode=ro"
+        self.connection = sqlite3.connect(uri,uri=True,check_same_thread=False)
+        self.count = self.connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+    
+    # the connection cannot be handed to worker processes, they open their own
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        for name in ["lock","rows","connection"]:
+            del state[name]
+        return state
+    
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self.connect()
+    
+    # returns the row of one item, loading it and the following rows if needed
+    def row(self,key):
+        if not key in self.rows:
+            self.load(range(key,min(key+self.read_ahead,self.count)))
+        return self.rows[key]
+    
+    # loads the given items that are not in memory yet
+    def load(self,keys):
+        missing = [int(key) for key in keys if not key in self.rows]
+        # SQLite limits the number of parameters per query
+        for start in range(0,len(missing),900):
+            block = missing[start:start+900]
+            with self.lock:
+                result = self.connection.execute("SELECT {} FROM items WHERE key IN ({})".format(",".join(sqlite_columns),",".join("?"*len(block))),block).fetchall()
+            for values in result:
+                self.store(values)
+    
+    # turns a row of the database into the values of the csv lists
+    def store(self,values):
+        row = dict(zip(sqlite_columns,values))
+        n = round((row["set_type"]-1)/2)
+        row["a"] = [row["a"+str(j)] for j in range(1,n+1)]
+        row["b"] = [row["b"+str(j)] for j in range(1,n+1)]
+        row["raw"] = row["raw"].split(",")
+        self.rows[row["key"]] = row
+    
+    def coefficients(self,keys):
+        self.load(keys)
+        a = np.zeros((len(keys),self.expansion))
+        b = np.zeros((len(keys),self.expansion))
+        c = np.zeros(len(keys))
+        for i in range(len(keys)):
+            row = self.rows[int(keys[i])]
+            a[i,:len(row["a"])] = row["a"]
+            b[i,:len(row["b"])] = row["b"]
+            c[i] = row["c"]
+        return a, b, c
+    
+    # returns the keys of all items matching the filter, element and source filters run as queries in the database
+    def query(self,setting,str):
+        if str == "" or str == "All" or not setting in ["el","source"]:
+            return data.query(self,setting,str)
+        if setting == "el":
+            return self.select("element_key = ? OR z = ?",[str,str])
+        return self.select("instr(source, ?) > 0",[str])
+    
+    # returns the keys of all items matching the given fields, e.g., element="Fe", ox=3, for headless tools
+    def query_fields(self,**fields):
+        columns = {"element":"element_key","z":"z","ox":"ox","source":"source","set_type":"set_type"}
+        conditions = []
+        values = []
+        for name in fields:
+            conditions.append(columns[name]+" = ?")
+            values.append(fields[name])
+        if len(conditions) == 0:
+            return list(range(self.count))
+        return self.select(" AND ".join(conditions),values)
+    
+    # the width is taken from the database, so no rows are loaded for it
+    def source_width(self,keys):
+        keys = [int(key) for key in keys]
+        widths = []
+        with self.lock:
+            if len(keys) == self.count:
+                widths.append(self.connection.execute("SELECT MAX(LENGTH(source)) FROM items").fetchone()[0])
+            else:
+                for start in range(0,len(keys),900):
+                    block = keys[start:start+900]
+                    widths.append(self.connection.execute("SELECT MAX(LENGTH(source)) FROM items WHERE key IN ({})".format(",".join("?"*len(block))),block).fetchone()[0])
+        return max([6]+[width for width in widths if width is not None])
+    
+    def select(self,where,values):
+        with self.lock:
+            result = self.connection.execute("SELECT key FROM items WHERE {} ORDER BY key".format(where),values).fetchall()
+        return [values[0] for values in result]
+    
+    # the snapshot of a session holds all items, which are loaded at once for it
+    def snapshot(self):
+        self.load(range(self.count))
+        return data.snapshot(self)
+     
+# class to gather the anomalous scattering corrections f' and f'' tabulated by element and photon energy in keV
+class anomalous_data:
+    def __init__(self,filename):
+        self.filename = filename
+        
+        self.labels = []
+        self.valid = True
+        # alternative column names for f' and f''
+        self.aliases = {"fp":"f'","f1":"f'","fpp":"f''","f2":"f''"}
+        
+        self.retrieve_data(filename)
+        
+        if self.valid == True: # only build the tables if data is validated
+            self.build_tables()
+    
+    # feeds in the data from the csv
+    def retrieve_data(self,filename):
+        self.data = []
+        with open(filename,mode="r") as file:
+            for line in file:
+                if "element" in line.lower() and len(self.labels) == 0:
+                    for item in line.split(","):
+                        item = item.strip().lower()
+                        self.labels.append(self.aliases.get(item,item))
+                elif line.strip() != "":
+                    self.data.append(line.split(","))
+        # a file without header line has no labels at all and is rejected here as well
+        self.check_labels()
+    
+    # checks if all important labels are available
+    def check_labels(self):
+        errors = ""
+        for check in ["element","energy","f'","f''"]:
+            if not check in self.labels:
+                errors += "No column {} specified with '{}'.\n".format(check,check)
+        
+        if len(errors) > 0:
+            errors += "Make sure that the file is a properly formatted csv with commas (,) as separators no additional line breaks."
+            messagebox.showerror("Error in input file!", errors)
+            self.valid = False
+    
+    # sorts every element by energy once and precomputes the slopes of all segments,
+    # so a lookup only needs a bisection and one multiply-add per energy
+    def build_tables(self):
+        columns = {}
+        for row in self.data:
+            try:
+                el = row[self.labels.index("element")].strip()
+                values = (float(row[self.labels.index("energy")]),float(row[self.labels.index("f'")]),float(row[self.labels.index("f''")]))
+            except:
+                continue
+            columns.setdefault(el,[]).append(values)
+        
+        self.energy = {}
+        self.fp = {}
+        self.fpp = {}
+        self.fp_slope = {}
+        self.fpp_slope = {}
+        for el in columns:
+            # absorption edges are listed twice at the same energy, once for each side,
+            # so only the energy is sorted and tied rows keep the order of the file
+            table = np.array(columns[el])
+            table = table[np.argsort(table[:,0],kind="stable")]
+            self.energy[el] = table[:,0]
+            self.fp[el] = table[:,1]
+            self.fpp[el] = table[:,2]
+            with np.errstate(divide="ignore",invalid="ignore"):
+                step = np.diff(table[:,0])
+                self.fp_slope[el] = np.nan_to_num(np.diff(table[:,1])/step)
+                self.fpp_slope[el] = np.nan_to_num(np.diff(table[:,2])/step)
+    
+    # returns f' and f'' of one element at many energies in keV, linear between tabulated energies and constant outside
+    # elements without table return zero corrections
+    def lookup(self,el,energies):
+        energies = np.asarray(energies,dtype=float)
+        if not el in self.energy or len(self.energy[el]) == 0:
+            return np.zeros(energies.shape), np.zeros(energies.shape)
+        
+        energy = self.energy[el]
+        if len(energy) == 1:
+            return np.full(energies.shape,self.fp[el][0]), np.full(energies.shape,self.fpp[el][0])
+        
+        i = np.clip(np.searchsorted(energy,energies,side="right")-1,0,len(energy)-2)
+        delta = np.clip(energies,energy[0],energy[-1]) - energy[i]
+        fp = self.fp[el][i] + self.fp_slope[el][i] * delta
+        fpp = self.fpp[el][i] + self.fpp_slope[el][i] * delta
+        return fp, fpp
+    
+    # returns f' and f'' of the given items of a form factor database as (items x energies) arrays
+    # items of the same element share one lookup
+    def lookup_items(self,data,keys,energies):
+        energies = np.asarray(energies,dtype=float)
+        fp = np.zeros((len(keys),len(energies)))
+        fpp = np.zeros((len(keys),len(energies)))
+        cache = {}
+        for i in range(len(keys)):
+            el = data.el_list[keys[i]].strip()
+            if not el in cache:
+                cache[el] = self.lookup(el,energies)
+            fp[i], fpp[i] = cache[el]
+        return fp, fpp
+
+# converts between photon energy in keV and wavelength in Å (works in both directions)
+def energy_wavelength(value):
+    return 12.398419843320026/np.asarray(value,dtype=float)
+
+# returns the complex form factor f0(Q) + f'(E) + i f''(E) of the given items as an (items x energies x points) array
+# f0 is evaluated once per item and broadcast against the corrections of all energies
+def anomalous_form_factors(data,keys,q,energies,table):
+    f0 = data.evaluate(keys,q)
+    fp, fpp = table.lookup_items(data,keys,energies)
+    return f0[:,np.newaxis,:] + (fp + 1j*fpp)[:,:,np.newaxis]
+        
 # creates the search and request window
 class search_window:
     # initializes the base window
     def __init__(self):
         self.root = create_window("350x400+120+120", "Atomic Form Factor Selector")
+        # background loading of the database and filling of the listbox
+        self.load_task = None
+        self.fill_task = None
         self.frame_selection_buttons()
         self.frame_about_button()
         self.open_button()
@@ -259,11 +704,12 @@ SOFTWARE.
         def select_file():
             filetypes = (
                 ('csv files', '*.csv'),
+                ('SQLite files', '*.sqlite *.db'),
                 ('All files', '*.*')
             )
             
             filename = fd.askopenfilename(
-                title='Open CSV',
+                title='Open Database',
                 initialdir='./',
                 filetypes=filetypes)
             if os.path.isfile(filename) == True:
@@ -280,6 +726,37 @@ SOFTWARE.
         
         # button to make a mock database for demonstration purposes
         make_button.pack(side=tk.LEFT,expand=True)
+        
+        # button to restore a session saved from a plot window
+        restore_button = ttk.Button(
+            self._frame_buttons,
+            text='Restore Session',
+            command = lambda: self.restore_session()
+        )
+        restore_button.pack(side=tk.LEFT,expand=True)
+        
+        # button to convert a csv database into an indexed SQLite database
+        convert_button = ttk.Button(
+            self._frame_buttons,
+            text='Convert to SQLite',
+            command = lambda: convert_file()
+        )
+        convert_button.pack(side=tk.LEFT,expand=True)
+        def convert_file():
+            csv_filename = fd.askopenfilename(title='Open CSV', initialdir='./', filetypes=[('csv files', '*.csv'),('All files', '*.*')])
+            if os.path.isfile(csv_filename) == False:
+                return
+            Files = [('SQLite File', '*.sqlite'),
+                ('All Files', '*.*')]
+            db_filename = fd.asksaveasfilename(filetypes = Files, defaultextension = Files)
+            if db_filename == "" or db_filename == ():
+                return
+            try:
+                import_sqlite(csv_filename,db_filename)
+            except ValueError as error:
+                messagebox.showerror("Error in input file!", str(error))
+                return
+            self.build_rest(db_filename)
         # select where to save the mock database
         def save_file():
             Files = [('CSV File', '*.csv'),
@@ -291,31 +768,140 @@ SOFTWARE.
                 f.write("ITC,9,H,1,0,0.489918,20.6593,0.262003,7.74039,0.196767,49.5519,0.049879,2.20159,,,0.001305,This is an example\n")
     
     # feeds the information in the file into the window and program
-    def build_rest(self, filename):
+    # the database is parsed on a worker thread, on_ready is called once the search box is in place
+    def build_rest(self, filename, database=None, on_ready=None):
+        # tasks of a previous database would otherwise build the widgets again or fill the new listbox
+        if self.load_task is not None:
+            self.load_task.cancel(notify=False)
+            self.load_task = None
+        if self.fill_task is not None:
+            self.fill_task.cancel(notify=False)
+            self.fill_task = None
         for widget in self.root.winfo_children():
             widget.destroy()
         self.frame_selection_buttons()
         self.frame_about_button()
         self.open_button()
+        self.frame_progress()
         self.filename = filename
-        self.data = data(filename,self.root)
-        if self.data.valid == True:
-            self.root.geometry("650x600")
-            self.key = {}
-            self._search = {}
-            self.search_box()
+        
+        def ready(database):
+            self.load_task = None
+            self.data = database
+            if self.data.valid == True:
+                self.root.geometry("650x600")
+                self.key = {}
+                self._search = {}
+                self.search_box()
+                if on_ready is not None:
+                    on_ready()
+            else:
+                messagebox.showerror("Error in input file!", self.data.errors)
+                self.root.geometry("350x400")
+        
+        if database is None:
+            self.load_task = background_task(self.root,
+                                             lambda task: open_database(filename,self.root,quiet=True,progress=task.progress),
+                                             on_done=ready,
+                                             frame=self._frame_progress,
+                                             text="Loading database")
         else:
-            self.root.geometry("350x400")
+            ready(database)
     
-    # turns the data into strings that are displayed as options in a listbox
-    def stringify_data(self, data, keys, listbox):
-        concatenate = ""
-        max_len = 6 # length of source string is variable, but should be at least this long
-        # determines the length of the longest source string
-        for i in keys:
-            str_len = len(data.sources_list[i])
-            if str_len > max_len:
-                max_len = str_len
+    # frame holding the progress bars of background tasks
+    def frame_progress(self):
+        self._frame_progress = tk.Frame(self.root)
+        self._frame_progress.pack(side=tk.BOTTOM,fill=tk.X)
+    
+    # fills the listbox with the given items, the rows are formatted on a worker thread and inserted in increments
+    def fill_listbox(self, keys, on_done=None):
+        # a fill that is still running would mix its rows into the new ones
+        if self.fill_task is not None:
+            self.fill_task.cancel(notify=False)
+        self._lbx.delete(0, "end")
+        keys = list(keys)
+        self.shown_keys = keys
+        
+        def work(task):
+            max_len = self.data.source_width(keys)
+            # the rows of a SQLite database are loaded block by block as they are formatted
+            for start in range(0,len(keys),1000):
+                self.data.load(keys[start:start+1000])
+                task.partial(self.stringify_data(self.data,keys[start:start+1000],max_len))
+                task.progress(min(start+1000,len(keys)),len(keys))
+        
+        def insert(rows):
+            for row in rows:
+                self._lbx.insert("anchor", row)
+        
+        def done(result):
+            self.fill_task = None
+            if on_done is not None:
+                on_done()
+        
+        self.fill_task = background_task(self.root,work,on_partial=insert,on_done=done,frame=self._frame_progress,text="Building index")
+    
+    # restores database, filter, selection, and plot from a session file
+    # parsing and evaluation are skipped if the database file is unchanged since the session was saved
+    def restore_session(self):
+        Files = [('Session File', '*.npz'),
+            ('All Files', '*.*')]
+        filename = fd.askopenfilename(title='Open Session', initialdir='./', filetypes = Files)
+        if os.path.isfile(filename) == False:
+            return
+        try:
+            state, curves, snapshot = load_session(filename)
+        except (KeyError, ValueError, OSError) as error:
+            messagebox.showerror("Error in session file!", "{} is not a valid session file.\n{}".format(filename,error))
+            return
+        
+        database = None
+        if fingerprint_unchanged(state["database"]["filename"],state["fingerprint"]) == True:
+            database = data.from_snapshot(state["database"]["filename"],snapshot,state["fingerprint"])
+        elif os.path.isfile(state["database"]["filename"]) == False:
+            messagebox.showwarning("Session", "Database {} not found, the copy stored in the session is used.".format(state["database"]["filename"]))
+            database = data.from_snapshot(state["database"]["filename"],snapshot,state["fingerprint"])
+        else:
+            # the database has changed, so the filter is applied again and all curves are recalculated
+            curves = None
+        
+        # continues once the database is loaded
+        def restore_listbox():
+            # compositions are stored in their input format and numbered again in order,
+            # sessions saved before compositions existed only list the selected items
+            plotted = []
+            n_compositions = 0
+            for key in state.get("plotted",state["selected"]):
+                if isinstance(key,str):
+                    n_compositions += 1
+                    key = parse_compositions(key)[0]
+                    key.name = "c"+str(n_compositions)
+                plotted.append(key)
+            if curves is None:
+                shown_keys = self.data.query(*state["filter"])
+                selected = [key for key in state["selected"] if key < len(self.data.data)]
+                plotted = [key for key in plotted if max(getattr(key,"keys",[key])) < len(self.data.data)]
+            else:
+                shown_keys = state["shown"]
+                selected = state["selected"]
+            self.active_filter = state["filter"]
+            
+            # continues once the listbox is filled
+            def restore_selection():
+                for i in range(self._lbx.size()):
+                    if int(self._lbx.get(i).split()[0]) in selected:
+                        self._lbx.selection_set(i)
+                if len(plotted) > 0:
+                    plot = plot_window(plotted,self.data,self,state["plot"],curves)
+            
+            self.fill_listbox(shown_keys,restore_selection)
+        
+        self.build_rest(state["database"]["filename"],database,restore_listbox)
+    
+    # turns the data into strings that are displayed as options in a listbox,
+    # max_len is the width of the source column
+    def stringify_data(self, data, keys, max_len):
+        rows = []
         custom_str = "{:>"+str(max_len)+"} "
         
         # formats and concatenates all the data for every given item before inserting them into the listbox
@@ -335,8 +921,8 @@ SOFTWARE.
                 concatenate += "{:8.4f} ".format(data.a_list[i][j])
                 concatenate += "{:8.4f} ".format(data.b_list[i][j])
             concatenate += "{}".format(data.comment[i])
-            listbox.insert("anchor", concatenate)
-        return concatenate
+            rows.append(concatenate)
+        return rows
     
     # center piece of the search window
     def search_box(self):
@@ -392,57 +978,14 @@ SOFTWARE.
             # function that refreshes the content of the listbox
             def refresh(setting):
                 
-                # function that filters the data according to provided entry and clicked button
-                def get_subset(str, data, setting):
-                    new_data = []
-                    keys = []
-                    perfect_match = False
-                    check = [""] * len(self.data.el_list)
-                    check_alt = [""] * len(self.data.el_list)
-                    
-                    # determine from where to retrieve the reference data
-                    if setting == "el":
-                        check = self.data.el_list
-                        check_alt = self.data.Z_list
-                        perfect_match = True
-                    if setting == "source":
-                        check = self.data.sources_list
-                    
-                    # determine which items from the reference data are retained
-                    if str == "" or str == "All" or setting == "reset":
-                        new_data = data
-                        for i in range(len(data)):
-                            keys.append(i)
-                    elif setting == "index":
-                        for i in str.split(","):
-                            try:
-                                i = int(i)
-                            except:
-                                messagebox.showerror("Input Error", "Only numbers, spaces, and commas are valid inputs.")
-                                break
-                            if i > len(data):
-                                messagebox.showerror("Input Error", "Numbers must be between {} and {}.".format(0,len(data)-1))
-                                break
-                            new_data.append(data[i])
-                            keys.append(i)
-                    else:
-                        for i in range(len(data)):
-                            if str == check[i].split(" ")[0] and perfect_match == True or str in check[i] and perfect_match == False:
-                                new_data.append(data[i])
-                                keys.append(i)
-                            elif str == check_alt[i] and perfect_match == True:
-                                new_data.append(data[i])
-                                keys.append(i)                                
-                    return new_data, keys
-                
                 # updates the listbox with the new data, resets entry string
                 if setting == "reset":
-                    data, keys = get_subset("",self.data.data,setting)
+                    self.active_filter = ["reset",""]
                 else:
-                    data, keys = get_subset(self._search[setting].get(),self.data.data,setting)
+                    self.active_filter = [setting,self._search[setting].get()]
                     self._search[setting].delete(0, "end")
-                self._lbx.delete(0, "end")
-                self.stringify_data(self.data,keys,self._lbx)
+                keys = self.data.query(*self.active_filter)
+                self.fill_listbox(keys)
                 
         # frame containing the listbox"
         def frame_listbox():
@@ -456,11 +999,7 @@ SOFTWARE.
             self._label = tk.Label(self._label_frame, bg="white")
             
             # generates labels similar to stringify function, maybe put together
-            max_len = 6
-            for i in range(len(self.data.data)):
-                str_len = len(self.data.sources_list[i])
-                if str_len > max_len:
-                    max_len = str_len
+            max_len = self.data.source_width(range(len(self.data.data)))
             custom_str = "{:>"+str(max_len)+"} "
             
             concatenate = ""
@@ -489,7 +1028,8 @@ SOFTWARE.
             # adds the data as stringified items
             def additems():
                 keys = range(len(self.data.data))
-                self.stringify_data(self.data,keys,self._lbx)
+                self.active_filter = ["reset",""]
+                self.fill_listbox(keys)
             additems()
             
         # adds a scrollbar
@@ -518,7 +1058,180 @@ SOFTWARE.
                     
                 # only plot if something is selected
                 if len(choice) > 0:
-                    plot = plot_window(choice,self.data)
+                    plot = plot_window(choice,self.data,self)
+        
+        # widgets to export one figure per element, oxidation state, or source for all items shown in the listbox
+        def batch_export_frame():
+            self._frame_batch = tk.Frame(self.root)
+            self._frame_batch.pack(side=tk.BOTTOM,fill=tk.X)
+            
+            self._label_batch = ttk.Label(self._frame_batch,text="Batch export per")
+            self._label_batch.pack(side=tk.LEFT)
+            self._combo_grouping = ttk.Combobox(self._frame_batch,values=["element","oxidation","source"],state="readonly",width=10)
+            self._combo_grouping.current(0)
+            self._combo_grouping.pack(side=tk.LEFT)
+            
+            self._label_batch_format = ttk.Label(self._frame_batch,text="as")
+            self._label_batch_format.pack(side=tk.LEFT)
+            self._combo_format = ttk.Combobox(self._frame_batch,values=["png","svg","pdf"],state="readonly",width=5)
+            self._combo_format.current(0)
+            self._combo_format.pack(side=tk.LEFT)
+            
+            self._label_batch_dpi = ttk.Label(self._frame_batch,text="with dpi")
+            self._label_batch_dpi.pack(side=tk.LEFT)
+            self._entry_batch_dpi = ttk.Entry(self._frame_batch,width=6)
+            self._entry_batch_dpi.insert(tk.END, "100")
+            self._entry_batch_dpi.pack(side=tk.LEFT)
+            
+            self._button_batch = ttk.Button(self._frame_batch,text="Export",command = lambda: export())
+            self._button_batch.pack(side=tk.LEFT)
+            
+            # asks once for the target directory, then renders all figures without further dialogs
+            def export():
+                try:
+                    dpi = float(self._entry_batch_dpi.get())
+                except:
+                    messagebox.showerror("Input Error", "Only numbers are valid inputs.")
+                    return
+                directory = fd.askdirectory(title='Export Figures to', initialdir='./')
+                if directory == "" or directory == ():
+                    return
+                filenames = batch_export(self.data,self.shown_keys,self._combo_grouping.get(),directory,formats=(self._combo_format.get(),),dpi=dpi)
+                messagebox.showinfo("Batch Export", "Saved {} figures to {}.".format(len(filenames),directory))
+        
+        # widgets to rank the items shown in the listbox against a reference curve from the selection or a file
+        def best_match_frame():
+            self._frame_match = tk.Frame(self.root)
+            self._frame_match.pack(side=tk.BOTTOM,fill=tk.X)
+            
+            self._label_match = ttk.Label(self._frame_match,text="Best matches to")
+            self._label_match.pack(side=tk.LEFT)
+            self._combo_reference = ttk.Combobox(self._frame_match,values=["selected item","file in Q","file in 2θ"],state="readonly",width=12)
+            self._combo_reference.current(0)
+            self._combo_reference.pack(side=tk.LEFT)
+            
+            # wavelength of a reference curve given in 2θ
+            self._label_match_lambda = ttk.Label(self._frame_match,text="λ [Å]")
+            self._label_match_lambda.pack(side=tk.LEFT)
+            self._entry_match_lambda = ttk.Entry(self._frame_match,width=8)
+            self._entry_match_lambda.insert(tk.END, "0.709319")
+            self._entry_match_lambda.pack(side=tk.LEFT)
+            
+            self._label_match_top = ttk.Label(self._frame_match,text="top")
+            self._label_match_top.pack(side=tk.LEFT)
+            self._entry_match_top = ttk.Entry(self._frame_match,width=4)
+            self._entry_match_top.insert(tk.END, "5")
+            self._entry_match_top.pack(side=tk.LEFT)
+            
+            self.match_scale = tk.BooleanVar(value=False)
+            self._check_match_scale = ttk.Checkbutton(self._frame_match,text="scaled",variable=self.match_scale)
+            self._check_match_scale.pack(side=tk.LEFT)
+            
+            self._button_match = ttk.Button(self._frame_match,text="Find",command = lambda: find())
+            self._button_match.pack(side=tk.LEFT)
+            
+            # ranks the candidates, lists them in the listbox in order, plots them, and shows their deviations
+            # with "scaled", the matches are plotted multiplied by their scale factors
+            def find():
+                try:
+                    top = int(self._entry_match_top.get())
+                except:
+                    messagebox.showerror("Input Error", "Only integer numbers are valid inputs.")
+                    return
+                if top <= 0:
+                    messagebox.showerror("Input Error", "The number of matches must be at least 1.")
+                    return
+                
+                reference_key = None
+                weights = None
+                if self._combo_reference.get() == "selected item":
+                    selected_indices = self._lbx.curselection()
+                    if len(selected_indices) != 1:
+                        messagebox.showerror("Input Error", "Select exactly one item as reference.")
+                        return
+                    reference_key = int(self._lbx.get(selected_indices[0]).split()[0])
+                    x, q = plot_grid("q",0.709319)
+                    reference = self.data.evaluate([reference_key],q)[0]
+                else:
+                    Files = [('Data Files', '*.xy *.dat *.csv *.txt'),
+                        ('All Files', '*.*')]
+                    filename = fd.askopenfilename(title='Open Reference Curve', initialdir='./', filetypes = Files)
+                    if os.path.isfile(filename) == False:
+                        return
+                    if self._combo_reference.get() == "file in Q":
+                        q, reference, weights = read_reference_curve(filename,"q")
+                    else:
+                        try:
+                            lambda_wl = float(self._entry_match_lambda.get())
+                        except:
+                            messagebox.showerror("Input Error", "Only numbers are valid inputs.")
+                            return
+                        q, reference, weights = read_reference_curve(filename,"theta",lambda_wl)
+                
+                candidates = [key for key in self.shown_keys if key != reference_key]
+                if len(candidates) == 0:
+                    return
+                try:
+                    matches = best_matches(self.data,candidates,q,reference,weights,self.match_scale.get(),top)
+                except ValueError as error:
+                    messagebox.showerror("Error in input file!", str(error))
+                    return
+                keys = []
+                plot_keys = []
+                ranking = []
+                for rank, (key, rms, scale) in enumerate(matches):
+                    keys.append(key)
+                    if self.match_scale.get() == True:
+                        plot_keys.append(composition([key],[scale],"m"+str(rank+1)))
+                    else:
+                        plot_keys.append(key)
+                    ranking.append("{:3}. item {:5}  rms {:10.5f}  scale {:8.4f}".format(rank+1,key,rms,scale))
+                if reference_key is not None:
+                    keys = [reference_key] + keys
+                    plot_keys = [reference_key] + plot_keys
+                
+                self.active_filter = ["index",",".join(str(key) for key in keys)]
+                def plot():
+                    self._lbx.selection_set(0,"end")
+                    plot = plot_window(plot_keys,self.data,self)
+                    messagebox.showinfo("Best Matches", "\n".join(ranking))
+                self.fill_listbox(keys,plot)
+        
+        # widgets to plot compositions of items, e.g., "12:0.3,45:0.7; 12:0.5,45:0.5", together with the selected items
+        def composition_frame():
+            self._frame_composition = tk.Frame(self.root)
+            self._frame_composition.pack(side=tk.BOTTOM,fill=tk.X)
+            
+            self._label_composition = ttk.Label(self._frame_composition,text="Compositions item:weight,...;")
+            self._label_composition.pack(side=tk.LEFT)
+            self.composition = tk.StringVar()
+            self._entry_composition = ttk.Entry(self._frame_composition,textvariable=self.composition)
+            self._entry_composition.pack(side=tk.LEFT,expand=True,fill=tk.X)
+            
+            self._button_composition = ttk.Button(self._frame_composition,text="Plot",command = lambda: plot_compositions(self._entry_composition.get()))
+            self._button_composition.pack(side=tk.LEFT)
+            self._button_composition_file = ttk.Button(self._frame_composition,text="From File",command = lambda: load_compositions())
+            self._button_composition_file.pack(side=tk.LEFT)
+            
+            # reads one composition per line from a text file
+            def load_compositions():
+                Files = [('Text Files', '*.txt *.csv'),
+                    ('All Files', '*.*')]
+                filename = fd.askopenfilename(title='Open Compositions', initialdir='./', filetypes = Files)
+                if os.path.isfile(filename) == False:
+                    return
+                with open(filename,mode="r") as file:
+                    plot_compositions(file.read())
+            
+            def plot_compositions(text):
+                try:
+                    compositions = parse_compositions(text,len(self.data.data))
+                except ValueError as error:
+                    messagebox.showerror("Input Error", "Compositions must be given as item:weight pairs separated by commas, compositions separated by semicolons.\n"+str(error))
+                    return
+                choice = [int(self._lbx.get(i).split()[0]) for i in self._lbx.curselection()]
+                if len(choice) + len(compositions) > 0:
+                    plot = plot_window(choice+compositions,self.data,self)
         
         # places all the frames
         def widgets_order():
@@ -537,6 +1250,10 @@ SOFTWARE.
             search("reset")
             use_selection()
             
+            batch_export_frame()
+            best_match_frame()
+            composition_frame()
+            
             frame_listbox()
             label_listbox()
             listbox()
@@ -547,12 +1264,21 @@ SOFTWARE.
 # creates the window containing the plot
 class plot_window:
     # initializes the window and default plotting data
-    def __init__(self,keys,data):
+    def __init__(self,keys,data,search=None,settings=None,curves=None):
         
         self.root = create_window("1000x700+120+120", "Atomic Form Factor Plot")
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
             
         self.keys = keys
         self.data = data
+        # search window the items were selected in, its filter is stored in session files
+        self.search = search
+        # precomputed curves of a restored session, used once instead of evaluating
+        self.curves = curves
+        # background calculation of the curves
+        self.task = None
+        # background calculation of a Debye pattern
+        self.debye_task = None
         
         self.dpi_default = 100
         self.dpi_set = str(self.dpi_default)
@@ -561,9 +1287,34 @@ class plot_window:
         self.lambda_default = 0.709319
         self.lambda_set = str(self.lambda_default)
         
+        # isotropic temperature factor B [Å^2] applied to all curves
+        self.b_factor_default = 0.0
+        self.b_factor_set = str(self.b_factor_default)
+        
+        # optional table of anomalous scattering corrections
+        self.anomalous = None
+        
+        # settings of a restored session
+        if settings is not None:
+            self.mode = settings["mode"]
+            self.lambda_set = settings["lambda"]
+            self.dpi_set = settings["dpi"]
+            self.b_factor_set = settings["b_factor"]
+            if settings["anomalous"] != "" and os.path.isfile(settings["anomalous"]):
+                table = anomalous_data(settings["anomalous"])
+                if table.valid == True:
+                    self.anomalous = table
+                else:
+                    self.curves = None
+            elif settings["anomalous"] != "":
+                # the stored curves include f', so they are calculated again without it
+                messagebox.showwarning("Session", "Table of f' and f'' {} not found, the curves are calculated without it.".format(settings["anomalous"]))
+                self.curves = None
+        
         self.draw_window()
         self._entry_mode_dpi.insert(tk.END, self.dpi_set)
         self._entry_mode_theta.insert(tk.END, self.lambda_set)
+        self._entry_b_factor.insert(tk.END, self.b_factor_set)
         
     # populates the window with widgets
     def draw_window(self):
@@ -579,16 +1330,42 @@ class plot_window:
         except:
             messagebox.showerror("Input Error", "Only numbers are valid inputs.")
             self.lambda_set = self.lambda_default
+        try:
+            float(self._entry_b_factor.get())
+            self.b_factor_set = self._entry_b_factor.get()
+        except:
+            messagebox.showerror("Input Error", "Only numbers are valid inputs.")
+            self.b_factor_set = self.b_factor_default
         
+        self.cancel_task()
         for widget in self.root.winfo_children():
             widget.destroy()
         self.draw_window()
         self._entry_mode_theta.insert(tk.END, self.lambda_set)
+        self._entry_b_factor.insert(tk.END, self.b_factor_set)
+    
+    # stops the calculations of curves and of a Debye pattern that are still running
+    def cancel_task(self):
+        if self.task is not None:
+            self.task.cancel(notify=False)
+            self.task = None
+        if self.debye_task is not None:
+            self.debye_task.cancel(notify=False)
+            self.debye_task = None
+    
+    # stops the calculation before the window is closed, so the worker does not keep evaluating for a destroyed plot
+    def close(self):
+        self.cancel_task()
+        self.root.destroy()
     
     # frame containing all the buttons
     def buttons_frame(self):
         self._frame_buttons = tk.Frame(self.root)
         self._frame_buttons.pack(side=tk.TOP,fill=tk.X)
+        self._frame_buttons_table = tk.Frame(self.root)
+        self._frame_buttons_table.pack(side=tk.TOP,fill=tk.X)
+        self._frame_buttons_sweep = tk.Frame(self.root)
+        self._frame_buttons_sweep.pack(side=tk.TOP,fill=tk.X)
         self._frame_buttons_save = tk.Frame(self.root)
         self._frame_buttons_save.pack(side=tk.TOP,fill=tk.X)
         sep = ttk.Separator(self._frame_buttons_save,orient='horizontal')
@@ -617,6 +1394,30 @@ class plot_window:
                            command = lambda: self.mode_switch("q"))
             self._button_mode_q["text"] = "Calculate for x in Q [1/Å]"
             self._button_mode_q.pack(side=tk.LEFT)   
+            
+            # button to add f′ at the energy of the wavelength from a table of anomalous corrections
+            self._button_anomalous = ttk.Button(self._frame_buttons, command = lambda: load_anomalous())
+            if self.anomalous is None:
+                self._button_anomalous["text"] = "Load f′/f″ Table"
+            else:
+                self._button_anomalous["text"] = "Remove f′/f″ Table"
+            self._button_anomalous.pack(side=tk.LEFT)
+            
+            # loads a table or removes the loaded one, then redraws the plot
+            def load_anomalous():
+                if self.anomalous is not None:
+                    self.anomalous = None
+                else:
+                    Files = [('CSV File', '*.csv'),
+                        ('All Files', '*.*')]
+                    filename = fd.askopenfilename(title='Open f′/f″ Table', initialdir='./', filetypes = Files)
+                    if os.path.isfile(filename) == False:
+                        return
+                    table = anomalous_data(filename)
+                    if table.valid == False:
+                        return
+                    self.anomalous = table
+                self.mode_switch(self.mode)
                             
             # buttons for saving the plot data and plot image with option to specify the dpi of the image
             self._button_save_values = ttk.Button(self._frame_buttons_save, text = 'Save Plot Data', command = lambda : save_data())
@@ -640,6 +1441,180 @@ class plot_window:
             self._label_mode_dpi_2["text"] = "dpi."
             self._label_mode_dpi_2.pack(side=tk.LEFT)
             
+            # label and entry for the isotropic temperature factor, applied with the buttons for 2θ and Q
+            self._label_b_factor = ttk.Label(self._frame_buttons_sweep)
+            self._label_b_factor["text"] = "Isotropic B [Å²]:"
+            self._label_b_factor.pack(side=tk.LEFT)
+            
+            self._entry_b_factor = ttk.Entry(self._frame_buttons_sweep,width=8)
+            self._entry_b_factor.pack(side=tk.LEFT)
+            
+            # labels, entries, and button for the evaluation over a range of B values
+            self._label_sweep_1 = ttk.Label(self._frame_buttons_sweep)
+            self._label_sweep_1["text"] = "   B sweep from"
+            self._label_sweep_1.pack(side=tk.LEFT)
+            self._entry_sweep_start = ttk.Entry(self._frame_buttons_sweep,width=6)
+            self._entry_sweep_start.insert(tk.END, "0")
+            self._entry_sweep_start.pack(side=tk.LEFT)
+            
+            self._label_sweep_2 = ttk.Label(self._frame_buttons_sweep)
+            self._label_sweep_2["text"] = "to"
+            self._label_sweep_2.pack(side=tk.LEFT)
+            self._entry_sweep_stop = ttk.Entry(self._frame_buttons_sweep,width=6)
+            self._entry_sweep_stop.insert(tk.END, "5")
+            self._entry_sweep_stop.pack(side=tk.LEFT)
+            
+            self._label_sweep_3 = ttk.Label(self._frame_buttons_sweep)
+            self._label_sweep_3["text"] = "Å² in"
+            self._label_sweep_3.pack(side=tk.LEFT)
+            self._entry_sweep_num = ttk.Entry(self._frame_buttons_sweep,width=6)
+            self._entry_sweep_num.insert(tk.END, "11")
+            self._entry_sweep_num.pack(side=tk.LEFT)
+            
+            self._label_sweep_4 = ttk.Label(self._frame_buttons_sweep)
+            self._label_sweep_4["text"] = "steps as"
+            self._label_sweep_4.pack(side=tk.LEFT)
+            self._combo_sweep_style = ttk.Combobox(self._frame_buttons_sweep,values=["curves","map"],state="readonly",width=7)
+            self._combo_sweep_style.current(0)
+            self._combo_sweep_style.pack(side=tk.LEFT)
+            
+            self._button_sweep = ttk.Button(self._frame_buttons_sweep, text = 'Show B Sweep', command = lambda : b_sweep())
+            self._button_sweep.pack(side=tk.LEFT)
+            
+            # evaluates all items for all B values as one array and shows them in a new window
+            def b_sweep():
+                try:
+                    b_values = np.linspace(float(self._entry_sweep_start.get()),float(self._entry_sweep_stop.get()),int(self._entry_sweep_num.get()))
+                except:
+                    messagebox.showerror("Input Error", "Only numbers are valid inputs.")
+                    return
+                if len(b_values) < 1:
+                    messagebox.showerror("Input Error", "The number of B values must be at least 1.")
+                    return
+                damping = debye_waller_factor(self.q_save,b_values)
+                f = evaluate_form_factors(self.data,self.keys,self.q_save,float(self.lambda_set),self.anomalous)[:,np.newaxis,:] * damping[np.newaxis,:,:]
+                sweep_window(self.x_save,b_values,f,self.keys,self.data,self.mode,self._combo_sweep_style.get())
+            
+            # label, entries, and buttons for dense tables evaluated in tiles on a grid finer than the plot
+            self._label_table_1 = ttk.Label(self._frame_buttons_table)
+            self._label_table_1["text"] = "Dense table with"
+            self._label_table_1.pack(side=tk.LEFT)
+            
+            self._entry_table_points = ttk.Entry(self._frame_buttons_table,width=10)
+            self._entry_table_points.insert(tk.END, "1000000")
+            self._entry_table_points.pack(side=tk.LEFT)
+            
+            self._label_table_2 = ttk.Label(self._frame_buttons_table)
+            self._label_table_2["text"] = "points in"
+            self._label_table_2.pack(side=tk.LEFT)
+            
+            self._combo_table_dtype = ttk.Combobox(self._frame_buttons_table,values=["float64","float32"],state="readonly",width=8)
+            self._combo_table_dtype.current(0)
+            self._combo_table_dtype.pack(side=tk.LEFT)
+            
+            self._button_table = ttk.Button(self._frame_buttons_table, text = 'Export Table', command = lambda : save_table())
+            self._button_table.pack(side=tk.LEFT)
+            
+            self._button_table_stats = ttk.Button(self._frame_buttons_table, text = 'Export Statistics', command = lambda : save_statistics())
+            self._button_table_stats.pack(side=tk.LEFT)
+            
+            self._button_table_axis = ttk.Button(self._frame_buttons_table, text = 'Evaluate on Data Axis', command = lambda : save_on_axis())
+            self._button_table_axis.pack(side=tk.LEFT)
+            
+            self._button_debye = ttk.Button(self._frame_buttons_table, text = 'Debye Pattern from XYZ', command = lambda : debye())
+            self._button_debye.pack(side=tk.LEFT)
+            
+            # reads the number of points and the grid limits of the current mode
+            def table_settings():
+                try:
+                    num = int(self._entry_table_points.get())
+                except:
+                    messagebox.showerror("Input Error", "Only integer numbers are valid inputs.")
+                    return None
+                if self.mode == "q":
+                    start, stop = 0, 25
+                else:
+                    start, stop = 0, 165
+                return start, stop, num, np.dtype(self._combo_table_dtype.get())
+            
+            # handles saving the dense table to a binary .npy or a CSV file
+            def save_table():
+                settings = table_settings()
+                if settings is None:
+                    return
+                start, stop, num, dtype = settings
+                Files = [('NumPy Array', '*.npy'),
+                    ('CSV File', '*.csv'),
+                    ('All Files', '*.*')]
+                filename = fd.asksaveasfilename(filetypes = Files, defaultextension = Files)
+                if filename == "" or filename == ():
+                    return
+                export_dense_table(self.data,self.keys,filename,start,stop,num,self.mode,float(self.lambda_set),dtype,b_factor=float(self.b_factor_set),anomalous=self.anomalous)
+            
+            # handles saving min, max, mean, and standard deviation of every item on the dense grid
+            def save_statistics():
+                settings = table_settings()
+                if settings is None:
+                    return
+                start, stop, num, dtype = settings
+                Files = [('CSV File', '*.csv'),
+                    ('All Files', '*.*')]
+                self.savefile = fd.asksaveasfile(filetypes = Files, defaultextension = Files)
+                if self.savefile is None:
+                    return
+                stats = dense_statistics(self.data,self.keys,start,stop,num,self.mode,float(self.lambda_set),dtype,b_factor=float(self.b_factor_set),anomalous=self.anomalous)
+                with self.savefile as f:
+                    f.write("item,min,max,mean,std\n")
+                    for i in range(len(self.keys)):
+                        f.write("{},{:8.4f},{:8.4f},{:8.4f},{:8.4f}\n".format(self.labels(self.keys[i],"short"),stats.min[i],stats.max[i],stats.mean[i],stats.std[i]))
+            
+            # handles evaluating the items at the x values (Q or 2θ, depending on the mode) in the first column of a data file
+            def save_on_axis():
+                Files = [('Data Files', '*.xy *.xye *.dat *.csv *.txt'),
+                    ('All Files', '*.*')]
+                axis_file = fd.askopenfilename(title='Open Data Axis', initialdir='./', filetypes = Files)
+                if os.path.isfile(axis_file) == False:
+                    return
+                Files = [('CSV File', '*.csv'),
+                    ('All Files', '*.*')]
+                filename = fd.asksaveasfilename(filetypes = Files, defaultextension = Files)
+                if filename == "" or filename == ():
+                    return
+                evaluate_on_axis(self.data,self.keys,axis_file,filename,self.mode,float(self.lambda_set),dtype=np.dtype(self._combo_table_dtype.get()),b_factor=float(self.b_factor_set),anomalous=self.anomalous)
+            
+            # handles calculating I(Q) of a particle from an XYZ file on the grid of the current plot,
+            # the plotted items are preferred as form factors of their elements
+            def debye():
+                Files = [('XYZ File', '*.xyz'),
+                    ('All Files', '*.*')]
+                filename = fd.askopenfilename(title='Open Coordinates', initialdir='./', filetypes = Files)
+                if os.path.isfile(filename) == False:
+                    return
+                elements, coords = read_xyz(filename)
+                if len(elements) == 0:
+                    messagebox.showerror("Error in input file!", "No atoms found in the XYZ file.")
+                    return
+                try:
+                    keys = debye_form_factor_keys(self.data,elements,[key for key in self.keys if not isinstance(key,composition)])
+                except ValueError as error:
+                    messagebox.showerror("Error in input file!", str(error))
+                    return
+                if self.debye_task is not None:
+                    self.debye_task.cancel(notify=False)
+                
+                # the pair distances are histogrammed on a worker thread, progress is reported per chunk of atoms
+                x = self.x_save
+                q = self.q_save
+                mode = self.mode
+                def work(task):
+                    return debye_intensity(self.data,elements,coords,q,keys,progress=task.progress)
+                
+                def done(intensity):
+                    self.debye_task = None
+                    debye_window(x,intensity,mode,os.path.basename(filename),keys,self.data)
+                
+                self.debye_task = background_task(self.root,work,on_done=done,frame=self._frame_progress,text="Calculating Debye pattern")
+            
             # handles saving the plotted data to a CSV file
             def save_data():
                 Files = [('CSV File', '*.csv'),
@@ -669,10 +1644,15 @@ class plot_window:
                     messagebox.showerror("Input Error", "Only numbers are valid inputs.")
                     self.dpi_set = self.dpi_default
                 
+                # redraws with the curves already calculated, so the figure is complete before saving
+                self.cancel_task()
+                self.curves = (self.x_save,self.q_save,self.y_save)
                 for widget in self.root.winfo_children():
                     widget.destroy()
                 self.draw_window()
                 self._entry_mode_dpi.insert(tk.END, self.dpi_set)
+                self._entry_mode_theta.insert(tk.END, self.lambda_set)
+                self._entry_b_factor.insert(tk.END, self.b_factor_set)
                 
                 Files = [("PNG File", '*.png'),
                     ('All Files', '*.*')]
@@ -680,6 +1660,32 @@ class plot_window:
                 format_type = filename.split(".")[-1]
                 self.fig.savefig(filename, format=format_type,bbox_inches="tight",dpi=float(self.dpi_set))
             
+            # stores database, filter, selection, settings, and the evaluated curves in a session file
+            def save_session_file():
+                Files = [('Session File', '*.npz'),
+                    ('All Files', '*.*')]
+                filename = fd.asksaveasfilename(filetypes = Files, defaultextension = Files)
+                if filename == "" or filename == ():
+                    return
+                try:
+                    float(self._entry_mode_dpi.get())
+                    self.dpi_set = self._entry_mode_dpi.get()
+                except:
+                    pass
+                state = {
+                    "plot": {"mode": self.mode, "lambda": str(self.lambda_set), "dpi": str(self.dpi_set), "b_factor": str(self.b_factor_set), "anomalous": ""},
+                    "selected": [int(key) for key in self.keys if not isinstance(key,composition)],
+                    "plotted": [key.spec() if isinstance(key,composition) else int(key) for key in self.keys],
+                    "filter": ["reset",""],
+                    "shown": list(range(len(self.data.data))),
+                    }
+                if self.anomalous is not None:
+                    state["plot"]["anomalous"] = self.anomalous.filename
+                if self.search is not None:
+                    state["filter"] = list(self.search.active_filter)
+                    state["shown"] = [int(key) for key in self.search.shown_keys]
+                save_session(filename,self.data,state,(self.x_save,self.q_save,self.y_save))
+            
             # creates a new window containing an explanation on which formulae were used to generate the plot
             math_button = ttk.Button(
                 self._frame_buttons_save,
@@ -688,6 +1694,9 @@ class plot_window:
             )
             math_button.pack(side=tk.RIGHT,expand=False)
             
+            self._button_session = ttk.Button(self._frame_buttons_save, text = 'Save Session', command = lambda : save_session_file())
+            self._button_session.pack(side=tk.RIGHT)
+            
             def about():
                 about = create_window("650x400+120+120", "About the formulae")
                 about.config(bg='#AAAAAA')
@@ -735,129 +1744,1115 @@ Formula (2) describes the relationship between the scattering vector Q, the char
         
     # define the label for each plotted item
     def labels(self,key,setting):
-        label = ""
-        # long version for plot
-        if setting == "long":
-            label += "item "+str(key)+" "
-            label += "from "+self.data.sources_list[key]+": "
-            label += self.data.el_list[key]
-            if not self.data.ox_list[key] == 0:
-                if self.data.ox_list[key] > 0:
-                    label += "+"+str(self.data.ox_list[key])
-                else:
-                    label += str(self.data.ox_list[key])
-            if "ale" in self.data.comment[key]:
-                label += " valence"
-            label += ", parameters: "+str(self.data.set_list[key])
-        # short version as label for the plotted data
-        elif setting == "short":
-            label += str(key)+"_"
-            label += self.data.sources_list[key].replace(" ","_")+"_"
-            label += self.data.el_list[key]
-            if not self.data.ox_list[key] == 0:
-                if self.data.ox_list[key] > 0:
-                    label += "+"+str(self.data.ox_list[key])+"_"
-                else:
-                    label += str(self.data.ox_list[key])+"_"
-            if "ale" in self.data.comment[key]:
-                label += " val"
-            label += str(self.data.set_list[key])
-        return label
+        return make_label(self.data,key,setting)
     
-    # creates the plot with matplotlib
+    # creates the plot with matplotlib, the curves are calculated on a worker thread and added as they become ready
     def plot_form_factors(self): 
         # generates two subplots for f(q) and Δf(q)
         self.fig = Figure(figsize = (8, 6), 
                      dpi = 100) 
-        if len(self.keys) > 1:
-            axs = self.fig.subplots(2,sharex=True,height_ratios=(3,1))   
+        self.axs = form_factor_axes(self.fig,len(self.keys))
+        
+        # the evaluated curves are kept as arrays for the cursor and for saving the data
+        if self.curves is not None:
+            self.x_save, self.q_save, y = self.curves
         else:
-            axs = []
-            axs.append(self.fig.subplots(1))
-          
-        # colormap, iterator for colorwheel
-        cmap = mpl.cm.tab10
-        cpicker = -1
-        
-        # data for y-axis to be saved
-        self.y_save = []
-        
-        # determine fineness of plotting grid
-        if self.mode == "q":
-            x_base = np.linspace(0,25,num=251)
-        elif self.mode == "theta":
-            x_base = np.linspace(0,25,num=1001)
-            
-        # plot each selected item
-        for key in self.keys:
-            cpicker += 1
-            self.x_save = []
-            x = []
-            y = []
-            for i in x_base:
-                
-                # sums the Gaussians to return f(q)
-                tmp = 0
-                for ii in range(len(self.data.a_list[key])):
-                    tmp += self.data.a_list[key][ii] * math.exp(-self.data.b_list[key][ii] * (i/(4*math.pi))**2)
-                tmp += self.data.c_list[key]
-                
-                # transforms q into 2theta
-                if self.mode == "theta":
-                    lambda_wl = float(self.lambda_set)
-                    asin_content = i * lambda_wl/(4*math.pi)
-                    
-                    # ensures that only mathmatically meaningful values are input into the arcsin
-                    if abs(asin_content) < 0.99:
-                        value = math.asin(asin_content) * 360/math.pi
-                        x.append(value)
-                        y.append(tmp)
-                        self.x_save.append(value)
-                else:
-                    x.append(i)
-                    y.append(tmp)
-                    self.x_save.append(i)
-            
-            # plots x against y
-            axs[0].plot(x, y, label=self.labels(key,"long"),color=cmap(cpicker/10))
-            self.y_save.append(y)
-        
-        #determines title and labels for subplot 0 (f(q))
-        axs[0].set_ylabel("f(Q)")
-        axs[0].set_title("Atomic Form Factors")
-        axs[0].grid(zorder=-50,linestyle="--",alpha=0.5)
-        if self.mode == "Q":
-            axs[0].set_xlabel("Q [1/Å]")
-        elif self.mode == "theta":
-            axs[0].set_xlabel("2θ [°]")
-            axs[0].set_xlim([0,165])
-        
-        axs[0].legend()
-        
-        #determines title and labels for subplot 1 (Δf(q))
-        if len(self.keys) > 1:
-            cpicker = -1
-            axs[1].set_ylabel("Δf(Q)")
-            for i in range(0,len(self.keys)):
-                cpicker += 1
-                delta_y = []
-                for j in range(len(self.y_save[i])):
-                    delta_y.append(self.y_save[i][j]-self.y_save[0][j])
-                label = ""
-                axs[1].plot(self.x_save, delta_y,label=label,color=cmap(cpicker/10))
-            axs[1].set_xlim(axs[0].get_xlim())
-            axs[1].grid(zorder=-50,linestyle="--",alpha=0.5)
-            
-        # creates and places Tkinter canvas for the matplotlib figure
-        canvas = FigureCanvasTkAgg(self.fig, master = self.root)   
-        canvas.draw() 
-        canvas.get_tk_widget().pack(side=tk.TOP) 
+            self.x_save, self.q_save = plot_grid(self.mode,float(self.lambda_set))
+        self.y_save = np.empty((0,len(self.q_save)))
+        
+        # frame for the progress bar of the calculation
+        self._frame_progress = tk.Frame(self.root)
+        self._frame_progress.pack(side=tk.TOP,fill=tk.X)
+        
+        # creates and places Tkinter canvas for the matplotlib figure next to the text field for the cursor readout
+        self._frame_plot = tk.Frame(self.root)
+        self._frame_plot.pack(side=tk.TOP,expand=True,fill=tk.BOTH)
+        self.canvas = FigureCanvasTkAgg(self.fig, master = self._frame_plot)   
+        self.canvas.get_tk_widget().pack(side=tk.LEFT) 
+        
+        self._readout = tk.Text(self._frame_plot, wrap="none", width=30)
+        self._readout["font"] = "TkFixedFont"
+        self._readout.pack(side=tk.LEFT,expand=True,fill=tk.BOTH)
       
         # creates the matplotlib default toolbar 
-        toolbar = NavigationToolbar2Tk(canvas, self.root) 
+        toolbar = NavigationToolbar2Tk(self.canvas, self.root) 
         toolbar.update() 
-        canvas.get_tk_widget().pack(side=tk.TOP) 
+        
+        if self.curves is not None:
+            self.curves = None
+            self.add_curves(y)
+            self.finish_plot(None)
+            return
+        
+        keys = list(self.keys)
+        q = self.q_save
+        lambda_wl = float(self.lambda_set)
+        b_factor = float(self.b_factor_set)
+        anomalous = self.anomalous
+        
+        # evaluates the curves in blocks of items, so that they are drawn while the rest is calculated
+        def work(task):
+            block = 10
+            for start in range(0,len(keys),block):
+                task.partial(evaluate_form_factors(self.data,keys[start:start+block],q,lambda_wl,anomalous,b_factor))
+                task.progress(min(start+block,len(keys)),len(keys))
+        
+        self.task = background_task(self.root,work,on_partial=self.add_curves,on_done=self.finish_plot,on_cancel=self.finish_plot,frame=self._frame_progress,text="Calculating curves")
+        self.canvas.draw_idle()
+    
+    # draws the next block of curves
+    def add_curves(self,y):
+        start = len(self.y_save)
+        self.y_save = np.vstack((self.y_save,y))
+        plot_form_factor_curves(self.axs,self.data,self.keys,self.x_save,y,start,self.y_save[0])
+        self.canvas.draw_idle()
+    
+    # completes the plot once all curves are calculated, after a cancellation with the curves calculated so far
+    def finish_plot(self,result):
+        self.task = None
+        self.keys = self.keys[:len(self.y_save)]
+        if len(self.keys) == 0:
+            return
+        style_form_factor_axes(self.axs,self.mode,form_factor_title(float(self.lambda_set),self.anomalous,float(self.b_factor_set)))
+        
+        # the cursor works on the evaluated arrays, so moving the mouse never triggers a recalculation
+        cmap = mpl.cm.tab10
+        colors = [cmap(i/10) for i in range(len(self.keys))]
+        self.cursor = cursor_readout(self.canvas, self.axs, self.x_save, self.q_save, self.y_save, colors, self.keys, self._readout, self.mode, float(self.lambda_set))
+        self.canvas.draw() 
+
+# raised inside a background task once its Cancel button was pressed
+class task_cancelled(Exception):
+    pass
+
+# runs function(task) on the worker pool while the Tk event loop stays responsive
+# the function reports through task.progress(done,total) and task.partial(result), both pass a thread-safe queue
+# that is polled by the Tk event loop, which shows a progress bar with a Cancel button and calls the handlers
+class background_task:
+    def __init__(self,root,function,on_partial=None,on_done=None,on_cancel=None,frame=None,text=""):
+        self.root = root
+        self.on_partial = on_partial
+        self.on_done = on_done
+        self.on_cancel = on_cancel
+        self.queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.poll_interval = 50 # ms
+        
+        # label, progress bar, and Cancel button
+        self._frame = None
+        if frame is not None:
+            self._frame = tk.Frame(frame)
+            self._frame.pack(side=tk.TOP,fill=tk.X)
+            self._label = ttk.Label(self._frame,text=text)
+            self._label.pack(side=tk.LEFT)
+            self._progress = ttk.Progressbar(self._frame,mode="determinate",maximum=1.0)
+            self._progress.pack(side=tk.LEFT,expand=True,fill=tk.X)
+            self._button_cancel = ttk.Button(self._frame,text="Cancel",command = lambda: self.cancel())
+            self._button_cancel.pack(side=tk.LEFT)
+        
+        worker_pool.submit(self.run,function)
+        self.root.after(self.poll_interval,self.poll)
+    
+    # runs on the worker thread
+    def run(self,function):
+        try:
+            self.queue.put(("done",function(self)))
+        except task_cancelled:
+            self.queue.put(("cancelled",None))
+        except Exception as error:
+            self.queue.put(("error",error))
+    
+    # called from the worker thread, stops the function once Cancel was pressed
+    def progress(self,done,total):
+        if self.cancel_event.is_set():
+            raise task_cancelled()
+        self.queue.put(("progress",done/max(total,1)))
+    
+    # called from the worker thread, hands a partial result to the Tk event loop
+    def partial(self,result):
+        if self.cancel_event.is_set():
+            raise task_cancelled()
+        self.queue.put(("partial",result))
+    
+    # with notify, on_cancel is called once the worker has stopped, otherwise the task ends silently
+    def cancel(self,notify=True):
+        if notify == False:
+            self.on_cancel = None
+        self.cancel_event.set()
+    
+    # runs on the Tk main thread, handles all messages from the worker that arrived since the last poll
+    def poll(self):
+        while True:
+            try:
+                kind, payload = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            
+            if kind == "progress":
+                if self._frame is not None and self.cancel_event.is_set() == False:
+                    self._progress["value"] = payload
+            elif kind == "partial":
+                # results that arrive after Cancel are dropped
+                if self.on_partial is not None and self.cancel_event.is_set() == False:
+                    self.on_partial(payload)
+            else:
+                self.finish(kind,payload)
+                return
+        self.root.after(self.poll_interval,self.poll)
+    
+    # removes the progress bar and calls the handler of the outcome
+    def finish(self,kind,payload):
+        if self._frame is not None:
+            try:
+                self._frame.destroy()
+            except tk.TclError:
+                pass
+        if kind == "done" and self.cancel_event.is_set() == False:
+            if self.on_done is not None:
+                self.on_done(payload)
+        elif kind == "error":
+            messagebox.showerror("Error", str(payload))
+        elif self.on_cancel is not None:
+            self.on_cancel(None)
+
+# define the label for each plotted item, "long" for the plot legend and "short" for data columns and file names
+def make_label(data,key,setting):
+    if isinstance(key,composition):
+        return composition_label(data,key,setting)
+    label = ""
+    # long version for plot
+    if setting == "long":
+        label += "item "+str(key)+" "
+        label += "from "+data.sources_list[key]+": "
+        label += data.el_list[key]
+        if not data.ox_list[key] == 0:
+            if data.ox_list[key] > 0:
+                label += "+"+str(data.ox_list[key])
+            else:
+                label += str(data.ox_list[key])
+        if "ale" in data.comment[key]:
+            label += " valence"
+        label += ", parameters: "+str(data.set_list[key])
+    # short version as label for the plotted data
+    elif setting == "short":
+        label += str(key)+"_"
+        label += data.sources_list[key].replace(" ","_")+"_"
+        label += data.el_list[key]
+        if not data.ox_list[key] == 0:
+            if data.ox_list[key] > 0:
+                label += "+"+str(data.ox_list[key])+"_"
+            else:
+                label += str(data.ox_list[key])+"_"
+        if "ale" in data.comment[key]:
+            label += " val"
+        label += str(data.set_list[key])
+    return label
+
+# define the label for a composition from the labels of its items
+def composition_label(data,key,setting):
+    if setting == "long":
+        parts = []
+        for item, weight in zip(key.keys,key.weights):
+            label = data.el_list[item]
+            if data.ox_list[item] > 0:
+                label += "+"+str(data.ox_list[item])
+            elif data.ox_list[item] < 0:
+                label += str(data.ox_list[item])
+            parts.append("{:g} {} (item {})".format(weight,label,item))
+        return key.name+": "+" + ".join(parts)
+    return key.name+"_"+"_".join("{:g}x{}".format(weight,item) for item, weight in zip(key.keys,key.weights))
+
+# returns the plotting grid in Q and the matching x-axis values for the given mode
+def plot_grid(mode,lambda_wl):
+    # determine fineness of plotting grid
+    if mode == "q":
+        q = np.linspace(0,25,num=251)
+        return q, q
+    
+    q = np.linspace(0,25,num=1001)
+    # transforms q into 2theta, ensures that only mathmatically meaningful values are input into the arcsin
+    asin_content = q * lambda_wl/(4*math.pi)
+    q = q[np.abs(asin_content) < 0.99]
+    x = np.arcsin(q * lambda_wl/(4*math.pi)) * 360/math.pi
+    return x, q
+
+# returns the Debye-Waller factor exp(-B (Q/4π)^2) for an isotropic B in Å^2 on the given Q values,
+# for an array of B values one row per B, shared by the plot, the exports, and the B sweep so all damp alike
+def debye_waller_factor(q,b_factor,dtype=np.float64):
+    s2 = (np.asarray(q,dtype=dtype)/(4*math.pi))**2
+    return np.exp(-np.multiply.outer(np.asarray(b_factor,dtype=dtype),s2))
+
+# returns f(Q) of the given items and compositions, with a table of anomalous corrections f' at the photon energy
+# of the wavelength is added before the temperature factor is applied, so f0 + f' is damped as a whole
+def evaluate_form_factors(data,keys,q,lambda_wl,anomalous=None,b_factor=0.0,dtype=np.float64):
+    if any(isinstance(key,composition) for key in keys):
+        unique, weights = composition_matrix(keys)
+        return weights.dot(evaluate_form_factors(data,unique,q,lambda_wl,anomalous,b_factor,dtype))
+    
+    y = data.evaluate(keys,q,dtype)
+    if anomalous is not None:
+        fp, fpp = anomalous.lookup_items(data,keys,[energy_wavelength(lambda_wl)])
+        y += fp.astype(dtype)
+    if b_factor != 0:
+        y *= debye_waller_factor(q,b_factor,dtype)[np.newaxis,:]
+    return y
+
+# mixed site of several items with fractional weights, e.g., 0.3 Fe3+ and 0.7 Al3+, plotted and exported like an item
+class composition:
+    def __init__(self,keys,weights,name=""):
+        self.keys = list(keys)
+        self.weights = list(weights)
+        self.name = name
+    
+    def __str__(self):
+        return self.name
+    
+    # returns the composition in the input format, e.g., "12:0.3,45:0.7"
+    def spec(self):
+        return ",".join("{}:{:g}".format(key,weight) for key, weight in zip(self.keys,self.weights))
+
+# reads compositions separated by semicolons or line breaks, each a comma-separated list of item:weight pairs
+def parse_compositions(text,n_items=None):
+    compositions = []
+    for part in text.replace("\n",";").split(";"):
+        if part.strip() == "":
+            continue
+        keys = []
+        weights = []
+        for pair in part.split(","):
+            key, weight = pair.split(":")
+            key = int(key)
+            if n_items is not None and (key < 0 or key >= n_items):
+                raise ValueError("Numbers must be between {} and {}.".format(0,n_items-1))
+            keys.append(key)
+            weights.append(float(weight))
+        compositions.append(composition(keys,weights,"c"+str(len(compositions)+1)))
+    return compositions
+
+# sparse matrix in compressed row format, as weights of the compositions on the unique items
+class weight_matrix:
+    def __init__(self,indptr,indices,weights,n_columns):
+        self.indptr = np.asarray(indptr,dtype=np.int64)
+        self.indices = np.asarray(indices,dtype=np.int64)
+        self.weights = np.asarray(weights,dtype=float)
+        self.shape = (len(self.indptr)-1,n_columns)
+    
+    # multiplies the matrix with an (n_columns x points) array, only the non-zero weights enter the sums
+    # the rows are treated in blocks to bound the size of the (non-zeros x points) intermediate
+    def dot(self,f,block=4096):
+        result = np.zeros((self.shape[0],f.shape[1]),dtype=f.dtype)
+        for start in range(0,self.shape[0],block):
+            stop = min(start+block,self.shape[0])
+            lo, hi = self.indptr[start], self.indptr[stop]
+            if hi == lo:
+                continue
+            terms = f[self.indices[lo:hi]] * self.weights[lo:hi,np.newaxis].astype(f.dtype)
+            # reduceat needs non-empty rows, empty rows stay zero
+            starts = self.indptr[start:stop] - lo
+            filled = self.indptr[start+1:stop+1] > self.indptr[start:stop]
+            result[start:stop][filled] = np.add.reduceat(terms,starts[filled],axis=0)
+        return result
+
+# returns the unique items of a list of items and compositions and the weight matrix mapping them onto the list
+def composition_matrix(keys):
+    unique = []
+    column = {}
+    indptr = [0]
+    indices = []
+    weights = []
+    for key in keys:
+        if isinstance(key,composition):
+            pairs = zip(key.keys,key.weights)
+        else:
+            pairs = [(key,1.0)]
+        for item, weight in pairs:
+            if not item in column:
+                column[item] = len(unique)
+                unique.append(item)
+            indices.append(column[item])
+            weights.append(weight)
+        indptr.append(len(indices))
+    return unique, weight_matrix(indptr,indices,weights,len(unique))
+
+# returns f(Q) of many compositions at once as a (compositions x points) array,
+# every item is evaluated once and the compositions are formed by one sparse matrix product
+def composition_form_factors(data,compositions,q,lambda_wl=0.709319,anomalous=None,b_factor=0.0,dtype=np.float64):
+    return evaluate_form_factors(data,list(compositions),q,lambda_wl,anomalous,b_factor,dtype)
+
+# generates two subplots for f(q) and Δf(q), or only one for a single item
+def form_factor_axes(fig,n_keys):
+    if n_keys > 1:
+        axs = fig.subplots(2,sharex=True,height_ratios=(3,1))   
+    else:
+        axs = []
+        axs.append(fig.subplots(1))
+    return axs
+
+# plots the curves of the items keys[start:start+len(y)], Δf is taken relative to the curve y_first of the first item
+def plot_form_factor_curves(axs,data,keys,x,y,start,y_first):
+    # colormap, iterator for colorwheel
+    cmap = mpl.cm.tab10
+    for i in range(len(y)):
+        axs[0].plot(x, y[i], label=make_label(data,keys[start+i],"long"),color=cmap((start+i)/10))
+        if len(axs) > 1:
+            axs[1].plot(x, y[i]-y_first,label="",color=cmap((start+i)/10))
+
+# returns the plot title naming the corrections applied to the curves
+def form_factor_title(lambda_wl,anomalous=None,b_factor=0.0):
+    title = "Atomic Form Factors"
+    if anomalous is not None:
+        title += " incl. f′ at {:.4f} keV".format(energy_wavelength(lambda_wl))
+    if b_factor != 0:
+        title += " with B = {:g} Å²".format(b_factor)
+    return title
+
+# determines titles, labels, grids, and limits of the subplots once all curves are plotted
+def style_form_factor_axes(axs,mode,title):
+    #determines title and labels for subplot 0 (f(q))
+    axs[0].set_ylabel("f(Q)")
+    axs[0].set_title(title)
+    axs[0].grid(zorder=-50,linestyle="--",alpha=0.5)
+    if mode == "Q":
+        axs[0].set_xlabel("Q [1/Å]")
+    elif mode == "theta":
+        axs[0].set_xlabel("2θ [°]")
+        axs[0].set_xlim([0,165])
+    
+    axs[0].legend()
+    
+    #determines title and labels for subplot 1 (Δf(q))
+    if len(axs) > 1:
+        axs[1].set_ylabel("Δf(Q)")
+        axs[1].set_xlim(axs[0].get_xlim())
+        axs[1].grid(zorder=-50,linestyle="--",alpha=0.5)
+
+# draws f(Q) and Δf(Q) of the given items into a matplotlib figure, shared by the plot window and the batch export
+# precomputed curves (x, q, y) are drawn as they are
+def draw_form_factors(fig,data,keys,mode,lambda_wl,anomalous=None,b_factor=0.0,curves=None):
+    axs = form_factor_axes(fig,len(keys))
+    if curves is not None:
+        x, q, y = curves
+    else:
+        x, q = plot_grid(mode,lambda_wl)
+        y = evaluate_form_factors(data,keys,q,lambda_wl,anomalous,b_factor)
+    plot_form_factor_curves(axs,data,keys,x,y,0,y[0])
+    style_form_factor_axes(axs,mode,form_factor_title(lambda_wl,anomalous,b_factor))
+    return axs, x, q, y
+
+# sorts the given items into groups for the batch export, one figure is made per group
+def group_keys(data,keys,grouping):
+    groups = {}
+    for key in keys:
+        if grouping == "element":
+            name = data.el_list[key]
+        elif grouping == "oxidation":
+            name = data.el_list[key]
+            if data.ox_list[key] > 0:
+                name += "+"+str(data.ox_list[key])
+            elif data.ox_list[key] < 0:
+                name += str(data.ox_list[key])
+        elif grouping == "source":
+            name = data.sources_list[key]
+        else:
+            raise ValueError("Unknown grouping '{}', use 'element', 'oxidation', or 'source'.".format(grouping))
+        groups.setdefault(name.strip(),[]).append(key)
+    return groups
+
+# the database is handed to every worker process once instead of once per figure
+def batch_init(data):
+    global batch_data
+    batch_data = data
+
+# renders one figure off-screen in a worker process and saves it in all requested formats
+def batch_render(keys,basename,formats,dpi,mode,lambda_wl,b_factor=0.0):
+    fig = Figure(figsize = (8, 6), dpi = 100)
+    draw_form_factors(fig,batch_data,keys,mode,lambda_wl,b_factor=b_factor)
+    filenames = []
+    for format_type in formats:
+        filename = basename+"."+format_type
+        fig.savefig(filename, format=format_type,bbox_inches="tight",dpi=dpi)
+        filenames.append(filename)
+    return filenames
+
+# exports one figure per group of items (element, oxidation state, or source) without any dialogs
+# the figures are rendered in parallel by a pool of worker processes, returns the names of the written files
+def batch_export(data,keys,grouping,directory,formats=("png",),dpi=100,mode="theta",lambda_wl=0.709319,processes=None,b_factor=0.0):
+    groups = group_keys(data,keys,grouping)
+    
+    jobs = []
+    for name, group in groups.items():
+        # only keep characters that are safe in file names on all platforms
+        safe_name = "".join(char if char.isalnum() or char in "+-." else "_" for char in name)
+        basename = os.path.join(directory, grouping+"_"+safe_name)
+        jobs.append((group,basename,formats,dpi,mode,lambda_wl,b_factor))
+    
+    filenames = []
+    with ProcessPoolExecutor(max_workers=processes,initializer=batch_init,initargs=(data,)) as pool:
+        futures = [pool.submit(batch_render,*job) for job in jobs]
+        for future in futures:
+            filenames += future.result()
+    return filenames
+
+# yields the x-axis values of a linear grid in chunks, so that the full grid is never held in memory
+def grid_chunks(start,stop,num,chunk=100000):
+    step = 0
+    if num > 1:
+        step = (stop-start)/(num-1)
+    for i in range(0,num,chunk):
+        yield start + step*np.arange(i,min(i+chunk,num))
+
+# converts x-axis values of the given mode into Q
+def x_to_q(x,mode,lambda_wl):
+    if mode == "q":
+        return x
+    return 4*math.pi*np.sin(np.radians(x)/2)/lambda_wl
+
+# evaluates the items on chunks of x-axis values tile by tile and hands every (items x points) tile to the sinks
+# the tile size is derived from the memory budget in bytes, counting the temporaries of the evaluation (about three
+# tiles), the temporaries of the sinks per value (value_bytes), and the rows they buffer per point (row_bytes)
+# the x-axis values stay in float64, only f is evaluated in the given dtype
+def evaluate_tiled(data,keys,x_chunks,sinks,mode="q",lambda_wl=0.709319,dtype=np.float64,tile_items=1024,b_factor=0.0,anomalous=None,memory=2**27):
+    keys = list(keys)
+    value_bytes = 3*np.dtype(dtype).itemsize + sum(sink.value_bytes for sink in sinks)
+    row_bytes = 16 + sum(sink.row_bytes for sink in sinks) # x and Q in float64 and the buffered rows
+    tile_items = max(1,min(tile_items,len(keys),(memory-row_bytes)//value_bytes))
+    points = max(1,memory // (tile_items*value_bytes + row_bytes))
+    
+    point_offset = 0
+    for x_chunk in x_chunks:
+        x_chunk = np.asarray(x_chunk,dtype=np.float64)
+        for start in range(0,len(x_chunk),points):
+            x = x_chunk[start:start+points]
+            q = x_to_q(x,mode,lambda_wl)
+            for item_offset in range(0,len(keys),tile_items):
+                f = evaluate_form_factors(data,keys[item_offset:item_offset+tile_items],q,lambda_wl,anomalous,b_factor,dtype)
+                for sink in sinks:
+                    sink.add(item_offset,point_offset,x,f)
+            point_offset += len(x)
+    for sink in sinks:
+        sink.close()
+    return sinks
+
+# reducer that keeps the minimum, maximum, mean, and standard deviation of every item over all points
+class tile_statistics:
+    value_bytes = 24 # float64 copy, deviations, and their squares
+    row_bytes = 0
+    
+    def __init__(self,n_items):
+        self.count = np.zeros(n_items)
+        self.mean = np.zeros(n_items)
+        self.m2 = np.zeros(n_items)
+        self.min = np.full(n_items,np.inf)
+        self.max = np.full(n_items,-np.inf)
+    
+    # merges the moments of the tile into the running moments (Chan et al.), stable for many points
+    def add(self,item_offset,point_offset,x,f):
+        rows = slice(item_offset,item_offset+len(f))
+        f = f.astype(np.float64,copy=False)
+        n = f.shape[1]
+        if n == 0:
+            return
+        tile_mean = f.mean(axis=1)
+        tile_m2 = ((f - tile_mean[:,np.newaxis])**2).sum(axis=1)
+        
+        count = self.count[rows] + n
+        delta = tile_mean - self.mean[rows]
+        self.mean[rows] += delta * n/count
+        self.m2[rows] += tile_m2 + delta**2 * self.count[rows] * n/count
+        self.count[rows] = count
+        self.min[rows] = np.minimum(self.min[rows],f.min(axis=1))
+        self.max[rows] = np.maximum(self.max[rows],f.max(axis=1))
+    
+    def close(self):
+        self.std = np.sqrt(self.m2/np.maximum(self.count,1))
+
+# sink that writes the tiles into a .npy file on disk as one record per point,
+# the field "x" holds the x-axis value in float64 and the field "f" the values of all items in the given dtype
+class tile_npy_writer:
+    value_bytes = 0
+    row_bytes = 0
+    
+    def __init__(self,filename,n_items,n_points,dtype=np.float64):
+        record = np.dtype([("x",np.float64),("f",dtype,(n_items,))])
+        self.table = np.lib.format.open_memmap(filename,mode="w+",dtype=record,shape=(n_points,))
+    
+    def add(self,item_offset,point_offset,x,f):
+        points = slice(point_offset,point_offset+len(x))
+        if item_offset == 0:
+            self.table["x"][points] = x
+        self.table["f"][points,item_offset:item_offset+len(f)] = f.T
+    
+    def close(self):
+        self.table.flush()
+        del self.table
+
+# sink that writes the tiles into a CSV file, one row per point, only the rows of the current points are buffered
+# the rows are kept in float64, so the x-axis values are written at full precision
+class tile_csv_writer:
+    value_bytes = 0
+    
+    def __init__(self,filename,header,n_items):
+        self.file = open(filename,mode="w")
+        self.file.write(",".join(header)+"\n")
+        self.n_items = n_items
+        self.row_bytes = 8*(n_items+1)
+    
+    def add(self,item_offset,point_offset,x,f):
+        if item_offset == 0:
+            self.rows = np.empty((len(x),self.n_items+1),dtype=np.float64)
+            self.rows[:,0] = x
+        self.rows[:,item_offset+1:item_offset+1+len(f)] = f.T
+        
+        # the chunk is complete once the tile with the last item has arrived
+        if item_offset + len(f) == self.n_items:
+            np.savetxt(self.file,self.rows,fmt=["%.10g"]+["%.6f"]*self.n_items,delimiter=",")
+    
+    def close(self):
+        self.file.close()
+
+# writes a dense table of f for the given items on a linear grid to a .npy or .csv file
+def export_dense_table(data,keys,filename,start,stop,num,mode="q",lambda_wl=0.709319,dtype=np.float64,chunk=100000,tile_items=1024,b_factor=0.0,memory=2**27,anomalous=None):
+    keys = list(keys)
+    if filename.lower().endswith(".npy"):
+        sink = tile_npy_writer(filename,len(keys),num,dtype)
+    else:
+        if mode == "q":
+            header = ["Q/[1/Å]"]
+        else:
+            header = ["2theta/[°]"]
+        header += [make_label(data,key,"short") for key in keys]
+        sink = tile_csv_writer(filename,header,len(keys))
+    evaluate_tiled(data,keys,grid_chunks(start,stop,num,chunk),[sink],mode,lambda_wl,dtype,tile_items,b_factor,anomalous,memory)
+
+# yields the x-axis values in one column of a data file (e.g., a measured powder pattern) in chunks
+# the file is read line by line, header, comment, and other non-numeric lines are skipped
+def axis_chunks(filename,column=0,chunk=100000):
+    buffer = []
+    with open(filename,mode="r") as file:
+        for line in file:
+            items = line.replace(","," ").replace(";"," ").split()
+            if len(items) <= column:
+                continue
+            try:
+                buffer.append(float(items[column]))
+            except:
+                continue
+            if len(buffer) == chunk:
+                yield np.array(buffer)
+                buffer = []
+    if len(buffer) > 0:
+        yield np.array(buffer)
+
+# evaluates the items exactly at the x-axis values read from a data file and writes them to a CSV file
+# every output row belongs to the same x value as the corresponding data line of the input
+def evaluate_on_axis(data,keys,axis_file,filename,mode="theta",lambda_wl=0.709319,column=0,dtype=np.float64,chunk=100000,tile_items=1024,b_factor=0.0,memory=2**27,anomalous=None):
+    keys = list(keys)
+    if mode == "q":
+        header = ["Q/[1/Å]"]
+    else:
+        header = ["2theta/[°]"]
+    header += [make_label(data,key,"short") for key in keys]
+    sink = tile_csv_writer(filename,header,len(keys))
+    evaluate_tiled(data,keys,axis_chunks(axis_file,column,chunk),[sink],mode,lambda_wl,dtype,tile_items,b_factor,anomalous,memory)
+
+# reads a reference curve with columns x, f, and optionally weights from a data file
+# x is given in Q or in 2θ for the given wavelength, returns Q, f, and the weights (None without third column)
+def read_reference_curve(filename,mode="q",lambda_wl=0.709319):
+    columns = []
+    with open(filename,mode="r") as file:
+        for line in file:
+            items = line.replace(","," ").replace(";"," ").split()
+            try:
+                columns.append([float(item) for item in items[:3]])
+            except:
+                continue
+    rows = [row for row in columns if len(row) >= 2]
+    x = np.array([row[0] for row in rows])
+    f = np.array([row[1] for row in rows])
+    weights = None
+    if len(rows) > 0 and all(len(row) == 3 for row in rows):
+        weights = np.array([row[2] for row in rows])
+    return x_to_q(x,mode,lambda_wl), f, weights
+
+# ranks the given items by the weighted RMS deviation of their f(Q) from a reference curve on the same Q values
+# with scale, every item is first multiplied by the factor minimizing its deviation
+# the sums are taken as matrix-vector products over all items at once, returns the top (key, rms, scale) tuples
+def best_matches(data,keys,q,reference,weights=None,scale=False,top=10,b_factor=0.0,chunk=4096):
+    keys = list(keys)
+    reference = np.asarray(reference,dtype=float)
+    if weights is None:
+        weights = np.ones(len(reference))
+    weights = np.asarray(weights,dtype=float)
+    sum_w = weights.sum()
+    if len(reference) == 0:
+        raise ValueError("The reference curve contains no data points.")
+    if sum_w <= 0:
+        raise ValueError("The weights of the reference curve must sum to more than zero.")
+    sum_wrr = weights @ reference**2
+    
+    rms = np.empty(len(keys))
+    factors = np.ones(len(keys))
+    for start in range(0,len(keys),chunk):
+        # without table of anomalous corrections, no wavelength is needed
+        f = evaluate_form_factors(data,keys[start:start+chunk],q,None,None,b_factor)
+        sum_wff = (f**2) @ weights
+        sum_wfr = f @ (weights*reference)
+        # sum of w (s f - r)^2 = s^2 sum(w f f) - 2 s sum(w f r) + sum(w r r)
+        if scale == True:
+            s = np.divide(sum_wfr,sum_wff,out=np.ones(len(f)),where=sum_wff > 0)
+        else:
+            s = np.ones(len(f))
+        squares = s**2 * sum_wff - 2*s*sum_wfr + sum_wrr
+        rms[start:start+chunk] = np.sqrt(np.maximum(squares,0)/sum_w)
+        factors[start:start+chunk] = s
+    
+    if top < 1:
+        raise ValueError("The number of matches must be at least 1.")
+    top = min(top,len(keys))
+    best = np.argpartition(rms,top-1)[:top]
+    best = best[np.argsort(rms[best])]
+    return [(keys[i],float(rms[i]),float(factors[i])) for i in best]
+
+# returns min, max, mean, and standard deviation of f for the given items on a linear grid
+def dense_statistics(data,keys,start,stop,num,mode="q",lambda_wl=0.709319,dtype=np.float64,chunk=100000,tile_items=1024,b_factor=0.0,memory=2**27,anomalous=None):
+    keys = list(keys)
+    stats = tile_statistics(len(keys))
+    evaluate_tiled(data,keys,grid_chunks(start,stop,num,chunk),[stats],mode,lambda_wl,dtype,tile_items,b_factor,anomalous,memory)
+    return stats
+
+# reads element symbols and cartesian coordinates in Å from an XYZ file
+# a standard file starts with the number of atoms and a comment line, only the first frame is read then,
+# otherwise lines that are not atoms are skipped
+def read_xyz(filename):
+    elements = []
+    coords = []
+    with open(filename,mode="r") as file:
+        lines = file.readlines()
+    
+    # the comment line may be empty or look like an atom, so it is dropped by position
+    first = lines[0].split() if len(lines) > 0 else []
+    if len(first) == 1 and first[0].isdigit():
+        lines = lines[2:2+int(first[0])]
+    
+    for line in lines:
+        items = line.split()
+        if len(items) < 4:
+            continue
+        try:
+            xyz = [float(items[1]),float(items[2]),float(items[3])]
+        except:
+            continue
+        # strips charges and labels, e.g., Fe3+ or O1 become Fe and O
+        el = "".join(char for char in items[0] if char.isalpha())
+        elements.append(el)
+        coords.append(xyz)
+    return elements, np.array(coords,dtype=float).reshape(-1,3)
+
+# picks the database item used as form factor for each element, preferring the given items and neutral atoms
+def debye_form_factor_keys(data,elements,preferred=()):
+    keys = {}
+    for el in sorted(set(elements)):
+        candidates = [key for key in preferred if data.el_list[key] == el]
+        candidates += [key for key in range(len(data.data)) if data.el_list[key] == el]
+        if len(candidates) == 0:
+            raise ValueError("No form factor for element '{}' in the database.".format(el))
+        neutral = [key for key in candidates if data.ox_list[key] == 0]
+        if len(neutral) > 0:
+            keys[el] = neutral[0]
+        else:
+            keys[el] = candidates[0]
+    return keys
+
+# the coordinates are handed to every worker process once instead of once per chunk
+def debye_init(coords,types,n_types,bin_width,n_bins):
+    global debye_setup
+    debye_setup = (coords,types,n_types,bin_width,n_bins)
+
+# counts the distances between the atoms i0 to i1 and all atoms with a higher index into one histogram per element pair
+def debye_histogram_chunk(i0,i1):
+    coords, types, n_types, bin_width, n_bins = debye_setup
+    block = coords[i0:i1]
+    block_types = types[i0:i1]
+    
+    # element pairs are unordered, so (t,u) and (u,t) share a histogram
+    pair_table = np.minimum.outer(np.arange(n_types),np.arange(n_types))*n_types + np.maximum.outer(np.arange(n_types),np.arange(n_types))
+    pair_table *= n_bins
+    
+    # pairs within the block, each pair once
+    i, j = np.triu_indices(i1-i0,k=1)
+    bins = np.rint(np.linalg.norm(block[i]-block[j],axis=1)/bin_width).astype(np.int64)
+    counts = np.bincount(pair_table[block_types[i],block_types[j]]+bins,minlength=n_types*n_types*n_bins)
+    
+    # pairs between the block and all following atoms, the squared distances are summed in place per coordinate
+    if i1 < len(coords):
+        dist = np.zeros((i1-i0,len(coords)-i1))
+        for k in range(3):
+            diff = np.subtract.outer(block[:,k],coords[i1:,k])
+            diff *= diff
+            dist += diff
+        np.sqrt(dist,out=dist)
+        dist *= 1/bin_width
+        bins = np.rint(dist,out=dist).astype(np.int64)
+        if n_types > 1:
+            bins += pair_table[block_types[:,np.newaxis],types[np.newaxis,i1:]]
+        counts += np.bincount(bins.ravel(),minlength=len(counts))
+    return counts
+
+# computes I(Q) of a finite cluster or nanoparticle with the Debye scattering equation
+# I(Q) = sum_i f_i^2 + 2 sum_(i<j) f_i f_j sin(Q r_ij)/(Q r_ij), with the pair sum replaced by histograms of
+# the pair distances per element pair; the histograms are counted in chunks of atoms by a pool of worker processes
+def debye_intensity(data,elements,coords,q,keys=None,bin_width=0.002,processes=None,pairs_per_chunk=2000000,progress=None):
+    if keys is None:
+        keys = debye_form_factor_keys(data,elements)
+    species = sorted(set(elements))
+    n_types = len(species)
+    types = np.array([species.index(el) for el in elements],dtype=np.int64)
+    coords = np.asarray(coords,dtype=float)
+    n_atoms = len(coords)
+    
+    # the largest possible distance is the diagonal of the bounding box
+    max_dist = np.linalg.norm(coords.max(axis=0)-coords.min(axis=0))
+    n_bins = int(np.rint(max_dist/bin_width))+2
+    
+    # chunks of rows, each chunk covers about pairs_per_chunk distances at a time
+    rows = max(1,int(pairs_per_chunk/max(n_atoms,1)))
+    chunks = [(i0,min(i0+rows,n_atoms)) for i0 in range(0,n_atoms,rows)]
+    
+    # progress(done,total) is called after every chunk, it may raise to stop the calculation
+    counts = np.zeros(n_types*n_types*n_bins,dtype=np.int64)
+    if processes == 1 or len(chunks) == 1:
+        debye_init(coords,types,n_types,bin_width,n_bins)
+        for i, chunk in enumerate(chunks):
+            counts += debye_histogram_chunk(*chunk)
+            if progress is not None:
+                progress(i+1,len(chunks))
+    else:
+        pool = ProcessPoolExecutor(max_workers=processes,initializer=debye_init,initargs=(coords,types,n_types,bin_width,n_bins))
+        try:
+            futures = [pool.submit(debye_histogram_chunk,*chunk) for chunk in chunks]
+            for i, future in enumerate(futures):
+                counts += future.result()
+                if progress is not None:
+                    progress(i+1,len(chunks))
+        finally:
+            # chunks that have not started yet are dropped if the calculation was stopped
+            pool.shutdown(cancel_futures=True)
+    counts = counts.reshape(n_types,n_types,n_bins)
+    
+    q = np.asarray(q,dtype=float)
+    f = data.evaluate([keys[el] for el in species],q)
+    
+    # self scattering of every atom
+    intensity = (np.bincount(types,minlength=n_types)[:,np.newaxis] * f**2).sum(axis=0)
+    
+    # only bins that contain pairs enter the sinc matrix, which is built for blocks of Q to bound its size
+    used = np.nonzero(counts.sum(axis=(0,1)))[0]
+    r = used*bin_width
+    histograms = counts[:,:,used].reshape(n_types*n_types,len(used)).astype(float)
+    block = max(1,int(2000000/max(len(used),1)))
+    for start in range(0,len(q),block):
+        q_block = q[start:start+block]
+        sinc = np.sinc(np.outer(q_block,r)/math.pi)
+        pair_sums = (histograms @ sinc.T).reshape(n_types,n_types,len(q_block))
+        for t in range(n_types):
+            for u in range(t,n_types):
+                intensity[start:start+block] += 2 * f[t,start:start+block] * f[u,start:start+block] * pair_sums[t,u]
+    return intensity
+
+# exact Debye sum over all pairs of atoms, O(N²) and only feasible for small particles
+# serves as reference for the histogram in debye_intensity
+def debye_intensity_direct(data,elements,coords,q,keys=None):
+    if keys is None:
+        keys = debye_form_factor_keys(data,elements)
+    species = sorted(set(elements))
+    q = np.asarray(q,dtype=float)
+    coords = np.asarray(coords,dtype=float)
+    f = data.evaluate([keys[el] for el in species],q)[[species.index(el) for el in elements]]
+    
+    intensity = np.zeros(len(q))
+    for i in range(len(coords)):
+        r = np.linalg.norm(coords-coords[i],axis=1)
+        intensity += f[i] * (f * np.sinc(np.outer(r,q)/math.pi)).sum(axis=0)
+    return intensity
+
+# regression check of the binned Debye sum against the exact one on the first n_atoms atoms of a particle,
+# returns the largest deviation relative to the exact intensity
+def check_debye_intensity(data,elements,coords,q,keys=None,bin_width=0.002,n_atoms=200):
+    elements = list(elements)[:n_atoms]
+    coords = np.asarray(coords,dtype=float)[:n_atoms]
+    exact = debye_intensity_direct(data,elements,coords,q,keys)
+    binned = debye_intensity(data,elements,coords,q,keys,bin_width,processes=1)
+    return np.max(np.abs(binned-exact)/np.abs(exact))
+
+# returns size, modification time, and SHA-256 hash of a file
+def file_fingerprint(filename):
+    stat = os.stat(filename)
+    sha = hashlib.sha256()
+    with open(filename,mode="rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            sha.update(block)
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha.hexdigest()}
+
+# checks whether a file still matches its fingerprint, the hash is only calculated if the modification time differs
+def fingerprint_unchanged(filename,fingerprint):
+    if os.path.isfile(filename) == False:
+        return False
+    stat = os.stat(filename)
+    if stat.st_size != fingerprint["size"]:
+        return False
+    if stat.st_mtime == fingerprint["mtime"]:
+        return True
+    return file_fingerprint(filename)["sha256"] == fingerprint["sha256"]
+
+# writes a session as compressed .npz file, the settings are stored as JSON,
+# the parsed database and the evaluated curves (x, q, y) as binary arrays
+# a database restored from a session keeps the fingerprint of its file, which may not exist anymore
+def save_session(filename,data,state,curves):
+    state = dict(state)
+    state["version"] = 2
+    state["database"] = {"filename": os.path.abspath(data.filename)}
+    state["fingerprint"] = getattr(data,"fingerprint",None)
+    if state["fingerprint"] is None:
+        state["fingerprint"] = file_fingerprint(data.filename)
+    arrays = {"database_"+name: value for name, value in data.snapshot().items()}
+    x, q, y = curves
+    with open(filename,mode="wb") as file:
+        np.savez_compressed(file,state=np.array(json.dumps(state)),x=np.asarray(x),q=np.asarray(q),y=np.asarray(y),**arrays)
+
+# reads a session file, returns the settings, the evaluated curves (x, q, y), and the database snapshot
+def load_session(filename):
+    with np.load(filename,allow_pickle=False) as session:
+        state = json.loads(str(session["state"]))
+        curves = (session["x"],session["q"],session["y"])
+        if state["version"] == 1:
+            database = state["database"]
+        else:
+            database = {name[len("database_"):]: session[name] for name in session.files if name.startswith("database_")}
+    return state, curves, database
+
+# crosshair following the mouse in the plot window that shows Q, 2θ, f, and Δf of all curves at the cursor
+# only the crosshair and markers are redrawn (blitting), the rest of the figure is restored from a saved background
+class cursor_readout:
+    def __init__(self, canvas, axs, x, q, y, colors, keys, text_box, mode, lambda_wl):
+        self.canvas = canvas
+        self.axs = axs
+        self.x = np.asarray(x)
+        self.q = np.asarray(q)
+        self.y = np.asarray(y)
+        self.delta_y = self.y - self.y[0]
+        self.colors = colors
+        self.keys = keys
+        self.text_box = text_box
+        self.mode = mode
+        self.lambda_wl = lambda_wl
+        self.background = None
+        
+        # animated artists are skipped by canvas.draw() and only drawn during blitting
+        self.vlines = []
+        self.markers = []
+        self.hline = axs[0].axhline(color="grey",linewidth=0.8,linestyle=":",animated=True,visible=False)
+        for i in range(len(axs)):
+            self.vlines.append(axs[i].axvline(color="grey",linewidth=0.8,linestyle=":",animated=True,visible=False))
+            self.markers.append(axs[i].scatter([], [], s=20, c="k", zorder=50, animated=True, visible=False))
+        self.artists = self.vlines + self.markers + [self.hline]
+        
+        # one tag per curve so that each line of the readout has the colour of its curve
+        for i in range(len(self.keys)):
+            self.text_box.tag_configure("curve"+str(i), foreground=mpl.colors.to_hex(self.colors[i]))
+        self.text_box.config(state='disabled')
+        
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+        self.canvas.mpl_connect("motion_notify_event", self.on_move)
+        self.canvas.mpl_connect("figure_leave_event", self.on_leave)
+    
+    # saves the freshly drawn figure without the overlay, happens after resizing, zooming, and panning
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.blit()
+    
+    # restores the background and draws only the overlay on top of it
+    def blit(self):
+        if self.background is None:
+            return
+        self.canvas.restore_region(self.background)
+        for i in range(len(self.axs)):
+            self.axs[i].draw_artist(self.vlines[i])
+            self.axs[i].draw_artist(self.markers[i])
+        self.axs[0].draw_artist(self.hline)
+        self.canvas.blit(self.canvas.figure.bbox)
+        
+    # hides the overlay when the mouse leaves the figure
+    def on_leave(self, event):
+        for artist in self.artists:
+            artist.set_visible(False)
+        self.blit()
+    
+    # moves the crosshair to the grid point closest to the mouse and updates the readout
+    def on_move(self, event):
+        if event.inaxes not in self.axs or len(self.x) == 0:
+            self.on_leave(event)
+            return
+        
+        # x is monotonically increasing, so the closest point is found by bisection
+        i = np.searchsorted(self.x, event.xdata)
+        if i >= len(self.x):
+            i = len(self.x) - 1
+        elif i > 0 and event.xdata - self.x[i-1] < self.x[i] - event.xdata:
+            i -= 1
+        x = self.x[i]
+        
+        values = [self.y[:,i], self.delta_y[:,i]]
+        for j in range(len(self.axs)):
+            self.vlines[j].set_xdata([x, x])
+            self.markers[j].set_offsets(np.column_stack((np.full(len(values[j]), x), values[j])))
+            self.markers[j].set_facecolors(self.colors)
+        if event.inaxes == self.axs[0]:
+            self.hline.set_ydata([event.ydata, event.ydata])
+        for artist in self.artists:
+            artist.set_visible(True)
+        self.hline.set_visible(event.inaxes == self.axs[0])
+        self.blit()
+        
+        self.update_text(i)
+    
+    # writes Q, 2θ, f, and Δf at grid point i into the text field
+    def update_text(self, i):
+        q = self.q[i]
+        if self.mode == "theta":
+            two_theta = "{:8.3f}".format(self.x[i])
+        else:
+            asin_content = q * self.lambda_wl/(4*math.pi)
+            if abs(asin_content) < 1.0:
+                two_theta = "{:8.3f}".format(math.asin(asin_content) * 360/math.pi)
+            else:
+                two_theta = "{:>8}".format("-")
+        
+        self.text_box.config(state='normal')
+        self.text_box.delete("1.0", "end")
+        self.text_box.insert("end", "Q  [1/Å] {:8.3f}\n".format(q))
+        self.text_box.insert("end", "2θ [°]   {}\n\n".format(two_theta))
+        self.text_box.insert("end", "{:>5} {:>9} {:>9}\n".format("item","f","Δf"))
+        for j in range(len(self.keys)):
+            line = "{:>5} {:9.4f} {:9.4f}\n".format(str(self.keys[j]), self.y[j][i], self.delta_y[j][i])
+            self.text_box.insert("end", line, "curve"+str(j))
+        self.text_box.config(state='disabled')
       
+# creates the window showing f(Q) of the plotted items for a range of B values, as families of curves or as maps
+class sweep_window:
+    def __init__(self,x,b_values,f,keys,data,mode,style):
+        self.root = create_window("900x700+120+120", "Temperature Factor Sweep")
+        self.x = x
+        self.b_values = b_values
+        self.f = f
+        self.keys = keys
+        self.data = data
+        self.mode = mode
+        
+        self._frame_buttons = tk.Frame(self.root)
+        self._frame_buttons.pack(side=tk.TOP,fill=tk.X)
+        self._button_save_values = ttk.Button(self._frame_buttons, text = 'Save Plot Data', command = lambda : self.save_data())
+        self._button_save_values.pack(side=tk.LEFT)
+        
+        # one subplot per item
+        fig = Figure(figsize = (8, 6), dpi = 100)
+        axs = fig.subplots(len(keys),sharex=True,squeeze=False)[:,0]
+        cmap = mpl.cm.viridis
+        for i in range(len(keys)):
+            if style == "map":
+                mesh = axs[i].pcolormesh(x, b_values, f[i], shading="auto", cmap=cmap)
+                fig.colorbar(mesh, ax=axs[i], label="f(Q)")
+                axs[i].set_ylabel("B [Å²]")
+            else:
+                for j in range(len(b_values)):
+                    axs[i].plot(x, f[i,j], color=cmap(j/max(len(b_values)-1,1)))
+                axs[i].set_ylabel("f(Q)")
+                axs[i].grid(zorder=-50,linestyle="--",alpha=0.5)
+            axs[i].set_title(make_label(data,keys[i],"long"),fontsize="small")
+        if style != "map":
+            norm = mpl.colors.Normalize(vmin=b_values[0],vmax=b_values[-1])
+            fig.colorbar(mpl.cm.ScalarMappable(norm=norm,cmap=cmap), ax=list(axs), label="B [Å²]")
+        if mode == "q":
+            axs[-1].set_xlabel("Q [1/Å]")
+        else:
+            axs[-1].set_xlabel("2θ [°]")
+        
+        canvas = FigureCanvasTkAgg(fig, master = self.root)
+        canvas.draw()
+        canvas.get_tk_widget().pack(side=tk.TOP)
+        toolbar = NavigationToolbar2Tk(canvas, self.root)
+        toolbar.update()
+    
+    # handles saving all curves to a CSV file, one column per item and B value
+    def save_data(self):
+        Files = [('CSV File', '*.csv'),
+            ('All Files', '*.*')]
+        savefile = fd.asksaveasfile(filetypes = Files, defaultextension = Files)
+        if savefile is None:
+            return
+        with savefile as f:
+            if self.mode == "q":
+                f.write("Q/[1/Å]")
+            else:
+                f.write("2theta/[°]")
+            for key in self.keys:
+                for b in self.b_values:
+                    f.write(","+make_label(self.data,key,"short")+"_B{:g}".format(b))
+            f.write("\n")
+            columns = self.f.reshape(-1,len(self.x))
+            for i in range(len(self.x)):
+                f.write("{:6.3f}".format(self.x[i]))
+                for j in range(len(columns)):
+                    f.write(",{:8.4f}".format(columns[j][i]))
+                f.write("\n")
+
+# creates the window containing the Debye scattering pattern of a particle
+class debye_window:
+    def __init__(self,x,intensity,mode,name,keys,data):
+        self.root = create_window("900x650+120+120", "Debye Scattering Pattern")
+        self.x = x
+        self.intensity = intensity
+        self.mode = mode
+        
+        self._frame_buttons = tk.Frame(self.root)
+        self._frame_buttons.pack(side=tk.TOP,fill=tk.X)
+        self._button_save_values = ttk.Button(self._frame_buttons, text = 'Save Plot Data', command = lambda : self.save_data())
+        self._button_save_values.pack(side=tk.LEFT)
+        
+        fig = Figure(figsize = (8, 6), dpi = 100)
+        ax = fig.subplots(1)
+        label = ", ".join(el+": item "+str(keys[el]) for el in keys)
+        ax.plot(x, intensity, label=label)
+        ax.set_yscale("log")
+        ax.set_ylabel("I(Q)")
+        ax.set_title("Debye Scattering Pattern of "+name)
+        ax.grid(zorder=-50,linestyle="--",alpha=0.5)
+        if mode == "q":
+            ax.set_xlabel("Q [1/Å]")
+        else:
+            ax.set_xlabel("2θ [°]")
+        ax.legend()
+        
+        canvas = FigureCanvasTkAgg(fig, master = self.root)
+        canvas.draw()
+        canvas.get_tk_widget().pack(side=tk.TOP)
+        toolbar = NavigationToolbar2Tk(canvas, self.root)
+        toolbar.update()
+    
+    # handles saving the pattern to a CSV file
+    def save_data(self):
+        Files = [('CSV File', '*.csv'),
+            ('All Files', '*.*')]
+        savefile = fd.asksaveasfile(filetypes = Files, defaultextension = Files)
+        if savefile is None:
+            return
+        with savefile as f:
+            if self.mode == "q":
+                f.write("Q/[1/Å],I\n")
+            else:
+                f.write("2theta/[°],I\n")
+            for i in range(len(self.x)):
+                f.write("{:6.3f},{:.6e}\n".format(self.x[i],self.intensity[i]))
+
 # function that ensures that the created windows do not become bigger than the screen
 def window_size_limiter(avail_wxh,req_wxh,req_offset_xy):
 
@@ -917,6 +2912,9 @@ def create_window(dimensions="500x350+100+100", title = "Tkinter Hello World", i
 # main program
 if __name__ == "__main__":
     
+    # required for the worker processes of the batch export in frozen executables
+    multiprocessing.freeze_support()
+    
     # matplotlib backend hooks for pyinstaller
     # mpl.use("TkAgg")
     mpl.use("pgf")